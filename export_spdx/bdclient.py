@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+import asyncio
+import collections
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+
+import aiohttp
+
+from export_spdx import cache
+from export_spdx import config
+from export_spdx import globals
+from export_spdx import retry
+from export_spdx import scheduler
+
+# File in the cache directory holding bearer tokens for reuse by later runs (--cache_token)
+TOKEN_CACHE_FILE = 'bearer_tokens.json'
+
+# Endpoint classes whose responses are shared between components (the same component resource is requested for
+# every version of a component) and kept after completion in a bounded LRU, together with its size
+SHARED_CLASSES = ('component',)
+SHARED_RESULTS_SIZE = 1024
+
+
+class BDClient:
+    # Single async client for all Black Duck API requests - one keep-alive connection pool shared by project
+    # lookup, paging and component enrichment, with the bearer token renewed automatically before it expires
+    def __init__(self, base_url, api_token, verify=True, timeout=15, token_cache=None):
+        self.base_url = base_url.rstrip('/')
+        self.api_token = api_token
+        self.token_cache = token_cache
+        self.ssl = None if verify else False
+        self.timeout = float(timeout)
+        self.session = None
+        self.sched = None
+        self.bearer_token = None
+        self.csrf_token = None
+        self.valid_until = datetime.datetime.now()
+        self.auth_lock = None
+        self.root_resources_dict = None
+        self.inflight = {}
+        self.results = collections.OrderedDict()
+        self.flight_hits = 0
+        self.flight_misses = 0
+        self.revalidation = {}
+        self.bytes_saved = 0
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        self.sched = scheduler.create_scheduler()
+        self.auth_lock = asyncio.Lock()
+        # --blackduck_timeout limits connecting and each wait for data (as the requests timeout did) rather than the
+        # whole request, so that large BOM pages can take longer to download
+        self.session = aiohttp.ClientSession(connector=self.sched.connector(),
+                                             timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.timeout,
+                                                                           sock_read=self.timeout))
+        if self.ssl is False:
+            logging.warning("ssl verification disabled, connection insecure")
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def authenticate(self):
+        if self.load_cached_token():
+            return
+        headers = {
+            'Authorization': f"token {self.api_token}",
+        }
+        try:
+            content, csrf_token = await retry.async_request(self.session, 'POST',
+                                                            f"{self.base_url}/api/tokens/authenticate", headers,
+                                                            self.ssl, reader=read_auth)
+        except aiohttp.ClientResponseError as exc:
+            if exc.status == 401:
+                logging.error("HTTP response status code = 401 (Unauthorized) - check the API token")
+            raise
+        self.bearer_token = content['bearerToken']
+        self.csrf_token = csrf_token
+        self.valid_until = datetime.datetime.now() + datetime.timedelta(
+            milliseconds=int(content['expiresInMilliseconds']))
+        logging.info(f"success: auth granted until {self.valid_until.astimezone()}")
+        self.save_cached_token()
+
+    def token_cache_key(self):
+        # Tokens are stored per server and API token, without storing the API token itself
+        return hashlib.sha256(f"{self.base_url} {self.api_token}".encode('utf-8')).hexdigest()
+
+    def read_token_cache(self):
+        try:
+            with open(self.token_cache, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write_token_cache(self, tokens):
+        # Written to a private temporary file and renamed so that concurrent runs never read a partial file
+        tmpfile = f"{self.token_cache}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.token_cache), exist_ok=True)
+            fd = os.open(tmpfile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump(tokens, f)
+            os.replace(tmpfile, self.token_cache)
+        except OSError as exc:
+            logging.warning(f"unable to write bearer token cache {self.token_cache} - {exc}")
+
+    def load_cached_token(self):
+        if not self.token_cache:
+            return False
+        entry = self.read_token_cache().get(self.token_cache_key())
+        if entry is None:
+            return False
+        self.bearer_token = entry['bearerToken']
+        self.csrf_token = entry['csrfToken']
+        self.valid_until = datetime.datetime.fromtimestamp(entry['validUntil'])
+        if self.token_expiring():
+            self.bearer_token = None
+            return False
+        logging.info(f"success: reusing cached auth valid until {self.valid_until.astimezone()}")
+        return True
+
+    def save_cached_token(self):
+        if not self.token_cache:
+            return
+        tokens = self.read_token_cache()
+        now = datetime.datetime.now().timestamp()
+        tokens = {key: entry for (key, entry) in tokens.items() if entry['validUntil'] > now}
+        tokens[self.token_cache_key()] = {
+            'bearerToken': self.bearer_token,
+            'csrfToken': self.csrf_token,
+            'validUntil': self.valid_until.timestamp(),
+        }
+        self.write_token_cache(tokens)
+
+    def discard_cached_token(self):
+        if not self.token_cache:
+            return
+        tokens = self.read_token_cache()
+        if tokens.pop(self.token_cache_key(), None) is not None:
+            self.write_token_cache(tokens)
+
+    def token_expiring(self):
+        return not self.bearer_token or datetime.datetime.now() > self.valid_until - datetime.timedelta(minutes=5)
+
+    async def auth_headers(self):
+        if self.token_expiring():
+            # If bearer token not set or nearing expiry - only one request authenticates, the others wait for it
+            async with self.auth_lock:
+                if self.token_expiring():
+                    await self.authenticate()
+        headers = {
+            'Authorization': f"Bearer {self.bearer_token}",
+        }
+        if self.csrf_token:
+            headers['X-CSRF-TOKEN'] = self.csrf_token
+        return headers
+
+    async def get(self, url, headers=None, params=None, epclass=None, reader=retry.read_json, share=True):
+        if not url.startswith('http'):
+            url = self.base_url + url
+        reqheaders = {
+            'accept': "application/json",
+        }
+        if headers:
+            reqheaders.update({key.lower(): value for (key, value) in headers.items()})
+        if not share:
+            return await self.fetch(url, reqheaders, params, epclass, reader)
+
+        # Single-flight - concurrent requests for the same resource share one request. Only the results of shared
+        # endpoint classes are kept once the request completes
+        key = (url, tuple(sorted((params or {}).items())), reqheaders['accept'], reader.__name__)
+        if key in self.results:
+            self.flight_hits += 1
+            self.results.move_to_end(key)
+            return self.results[key]
+        if key in self.inflight:
+            self.flight_hits += 1
+            return await asyncio.shield(self.inflight[key])
+
+        self.flight_misses += 1
+        future = asyncio.ensure_future(self.fetch(url, reqheaders, params, epclass, reader))
+        self.inflight[key] = future
+
+        def flight_done(fut):
+            del self.inflight[key]
+            if epclass in SHARED_CLASSES and not fut.cancelled() and fut.exception() is None:
+                self.results[key] = fut.result()
+                if len(self.results) > SHARED_RESULTS_SIZE:
+                    self.results.popitem(last=False)
+
+        future.add_done_callback(flight_done)
+        return await asyncio.shield(future)
+
+    async def fetch(self, url, reqheaders, params, epclass, reader):
+        # Responses are kept in the persistent cache with their ETag / Last-Modified validators - a stored response
+        # is reused while it is fresh (Cache-Control max-age) and otherwise revalidated with a conditional request
+        decode = decoders.get(reader)
+        if cache.store is None or decode is None:
+            return await self.request(url, reqheaders, params, epclass, reader)
+
+        key = json.dumps([url, sorted((params or {}).items()), reqheaders['accept']])
+        entry = cache.store.get_response(key)
+        if entry is not None and not cache.store.refresh and entry[3] > datetime.datetime.now().timestamp():
+            self.count_revalidation(epclass, 'hit', len(entry[2]))
+            return decode(entry[2])
+
+        reqheaders = dict(reqheaders)
+        if entry is not None:
+            if entry[0]:
+                reqheaders['if-none-match'] = entry[0]
+            if entry[1]:
+                reqheaders['if-modified-since'] = entry[1]
+        status, body, etag, modified, cache_control = await self.request(url, reqheaders, params, epclass,
+                                                                         read_validated)
+        max_age = get_max_age(cache_control)
+        if status == 304 and entry is not None:
+            self.count_revalidation(epclass, '304', len(entry[2]))
+            cache.store.revalidated(key, max_age)
+            return decode(entry[2])
+
+        self.count_revalidation(epclass, 'miss')
+        if (etag or modified or max_age > 0) and 'no-store' not in (cache_control or ''):
+            cache.store.put_response(key, etag, modified, body, max_age)
+        return decode(body)
+
+    def count_revalidation(self, epclass, result, size=0):
+        counts = self.revalidation.setdefault(epclass or 'other', {'hit': 0, 'miss': 0, '304': 0})
+        counts[result] += 1
+        self.bytes_saved += size
+
+    async def request(self, url, reqheaders, params, epclass, reader):
+        reqheaders = dict(reqheaders)
+        reqheaders.update(await self.auth_headers())
+        try:
+            return await self.sched.run(epclass, retry.async_request(self.session, 'GET', url, reqheaders, self.ssl,
+                                                                     params=params, reader=reader))
+        except aiohttp.ClientResponseError as exc:
+            if exc.status != 401:
+                raise
+        # Token rejected (for example revoked or expired early) - authenticate again and retry once
+        if reqheaders['Authorization'] == f"Bearer {self.bearer_token}":
+            self.bearer_token = None
+            self.discard_cached_token()
+        reqheaders.update(await self.auth_headers())
+        return await self.sched.run(epclass, retry.async_request(self.session, 'GET', url, reqheaders, self.ssl,
+                                                                 params=params, reader=reader))
+
+    def report(self):
+        self.sched.report()
+        print("Shared requests: {} hits, {} misses".format(self.flight_hits, self.flight_misses))
+        if len(self.revalidation) > 0:
+            print("HTTP cache by endpoint class: " + ', '.join(
+                "{} ({} hit, {} miss, {} not modified)".format(k, v['hit'], v['miss'], v['304'])
+                for k, v in sorted(self.revalidation.items())))
+            print("HTTP cache saved {:.1f} MB of response bodies".format(self.bytes_saved / (1024 * 1024)))
+
+    async def get_json(self, url, headers=None, params=None, epclass=None):
+        return await self.get(url, headers=headers, params=params, epclass=epclass)
+
+    async def get_text(self, url, headers=None, params=None, epclass=None, share=True):
+        return await self.get(url, headers=headers, params=params, epclass=epclass, reader=retry.read_text,
+                              share=share)
+
+    async def get_items(self, url, headers=None, params=None, page_size=250):
+        params = dict(params or {})
+        offset = 0
+        allitems = []
+        while True:
+            params.update({'offset': f"{offset}", 'limit': f"{page_size}"})
+            items = (await self.get_json(url, headers=headers, params=params)).get('items', list())
+            allitems += items
+            if len(items) < page_size:
+                # This will be true if there are no more 'pages' to view
+                break
+            offset += page_size
+        return allitems
+
+    async def get_root_resources(self):
+        if self.root_resources_dict is None:
+            resources_dict = dict(await self.get_json('/api/'))
+            resources_dict['href'] = self.base_url + '/api/'
+            resources_dict.pop('_meta', None)
+            self.root_resources_dict = resources_dict
+        return self.root_resources_dict
+
+    def list_resources(self, parent):
+        resources_dict = {}
+        for res in parent['_meta']['links']:
+            resources_dict[res['rel']] = res['href']
+        resources_dict['href'] = parent['_meta'].get('href')
+        return resources_dict
+
+    async def get_resource(self, name, parent=None, items=True, params=None):
+        if parent is None:
+            resources_dict = await self.get_root_resources()
+        else:
+            resources_dict = self.list_resources(parent)
+        if name not in resources_dict:
+            raise KeyError(f"resource name '{name}' not found in available resources")
+        url = resources_dict[name]
+
+        if items:
+            return await self.get_items(url, params=params)
+        else:
+            return await self.get_json(url, params=params)
+
+
+def get_client():
+    # One client per process, created on first use so that importing the package does not create it
+    if globals.bd is None:
+        token_cache = None
+        if config.args.cache_token:
+            token_cache = os.path.join(config.args.cache_dir, TOKEN_CACHE_FILE)
+        globals.bd = BDClient(
+            config.args.blackduck_url,
+            config.args.blackduck_api_token,
+            verify=globals.verify,  # TLS certificate verification
+            timeout=config.args.blackduck_timeout,
+            token_cache=token_cache
+        )
+    return globals.bd
+
+
+async def read_auth(resp):
+    return await resp.json(), resp.headers.get('X-CSRF-TOKEN')
+
+
+async def read_validated(resp):
+    return (resp.status, await resp.text('utf-8'), resp.headers.get('ETag'), resp.headers.get('Last-Modified'),
+            resp.headers.get('Cache-Control'))
+
+
+# Readers whose responses can be stored in the cache, and how to decode a stored response body for them
+decoders = {
+    retry.read_json: json.loads,
+    retry.read_text: lambda body: body,
+}
+
+
+def get_max_age(cache_control):
+    # Seconds a response may be reused without revalidation
+    if not cache_control or 'no-cache' in cache_control:
+        return 0
+    match = re.search(r'max-age=(\d+)', cache_control)
+    if match is None:
+        return 0
+    return int(match.group(1))
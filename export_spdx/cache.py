@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+import uuid
+
+# How long cached component data remains valid for each kind of data (seconds) - comments and custom fields are
+# edited in the BOM so are refreshed more often than data which comes from the Black Duck KnowledgeBase
+kind_ttls = {
+    'copyrights': 7 * 86400,
+    'comments': 86400,
+    'files': 7 * 86400,
+    'licenses': 30 * 86400,
+    'homepage': 30 * 86400,
+    'supplier': 86400,
+    'openhub': 90 * 86400,
+    'packages': 30 * 86400,
+}
+
+CACHE_FILE = 'component_data.db'
+
+# How long to wait for another export writing to the same cache database (seconds)
+LOCK_TIMEOUT = 30
+
+# Temporary files left in the shared cache by interrupted writers are removed by prune after this time (seconds)
+SHARED_TMP_AGE = 3600
+
+
+class DataCache:
+    # Persistent cache in an SQLite database holding component version data (keyed by component version URL and
+    # kind of data) and HTTP response bodies with their validators (keyed by request). The least recently used
+    # entries are removed when the database grows beyond max_size bytes. The database can be used by several exports
+    # at once - each write is committed straight away (with write-ahead logging so that readers are not blocked) and
+    # the access times of the entries read are only written when the cache is closed. Any database error disables
+    # the cache for the rest of the run rather than failing the export
+    def __init__(self, cache_dir, max_size, refresh=False):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, CACHE_FILE)
+        self.max_size = max_size
+        self.refresh = refresh
+        self.disabled = False
+        self.accessed = {}
+        self.responses_accessed = {}
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS entries (
+                           url TEXT NOT NULL, kind TEXT NOT NULL, value TEXT NOT NULL, size INTEGER NOT NULL,
+                           stored REAL NOT NULL, accessed REAL NOT NULL, PRIMARY KEY (url, kind))''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS responses (
+                           key TEXT PRIMARY KEY, etag TEXT, modified TEXT, body TEXT NOT NULL,
+                           size INTEGER NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL)''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+
+    def failed(self, exc):
+        if not self.disabled:
+            print("WARNING: Component data cache error - continuing without the cache\n" + str(exc))
+        self.disabled = True
+
+    def execute(self, sql, params):
+        # Returns the cursor, or None if the statement failed
+        if self.disabled:
+            return None
+        try:
+            return self.db.execute(sql, params)
+        except sqlite3.Error as exc:
+            self.failed(exc)
+            return None
+
+    def get(self, kind, url):
+        # Returns (True, value) for a valid cached entry, otherwise (False, None)
+        if not self.refresh:
+            now = time.time()
+            cursor = self.execute('SELECT value FROM entries WHERE url = ? AND kind = ? AND stored > ?',
+                                  (url, kind, now - kind_ttls[kind]))
+            row = cursor.fetchone() if cursor is not None else None
+            if row is not None:
+                self.accessed[(url, kind)] = now
+                self.hits += 1
+                return True, json.loads(row[0])
+        self.misses += 1
+        return False, None
+
+    def put(self, kind, url, value, stored=None):
+        now = time.time()
+        if stored is None:
+            stored = now
+        value = json.dumps(value)
+        self.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)',
+                     (url, kind, value, len(value), stored, now))
+
+    def get_response(self, key):
+        # Returns (etag, last modified, body, expiry time) for a stored response, or None
+        cursor = self.execute('SELECT etag, modified, body, expires FROM responses WHERE key = ?', (key,))
+        row = cursor.fetchone() if cursor is not None else None
+        if row is not None:
+            self.responses_accessed[key] = time.time()
+        return row
+
+    def put_response(self, key, etag, modified, body, max_age=0):
+        now = time.time()
+        self.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                     (key, etag, modified, body, len(body), now + max_age, now))
+
+    def revalidated(self, key, max_age=0):
+        self.execute('UPDATE responses SET expires = ? WHERE key = ?', (time.time() + max_age, key))
+
+    def write_accessed(self):
+        # Write the access times of the entries read since the last call in a single transaction
+        accessed = [(when, url, kind) for (url, kind), when in self.accessed.items()]
+        responses_accessed = [(when, key) for key, when in self.responses_accessed.items()]
+        self.accessed = {}
+        self.responses_accessed = {}
+        self.db.execute('BEGIN')
+        self.db.executemany('UPDATE entries SET accessed = ? WHERE url = ? AND kind = ?', accessed)
+        self.db.executemany('UPDATE responses SET accessed = ? WHERE key = ?', responses_accessed)
+        self.db.execute('COMMIT')
+
+    def evict(self):
+        # Remove expired entries, then the least recently used entries until the cache fits in max_size
+        now = time.time()
+        self.db.execute('BEGIN')
+        for kind, ttl in kind_ttls.items():
+            self.db.execute('DELETE FROM entries WHERE kind = ? AND stored <= ?', (kind, now - ttl))
+        total = self.db.execute('SELECT (SELECT COALESCE(SUM(size), 0) FROM entries) + '
+                                '(SELECT COALESCE(SUM(size), 0) FROM responses)').fetchone()[0]
+        if total > self.max_size:
+            cursor = self.db.execute('''SELECT 'entries', url, kind, size, accessed FROM entries
+                                       UNION ALL SELECT 'responses', key, '', size, accessed FROM responses
+                                       ORDER BY accessed''')
+            remove_entries = []
+            remove_responses = []
+            for table, key, kind, size, accessed in cursor:
+                if total <= self.max_size:
+                    break
+                if table == 'entries':
+                    remove_entries.append((key, kind))
+                else:
+                    remove_responses.append((key,))
+                total -= size
+            self.db.executemany('DELETE FROM entries WHERE url = ? AND kind = ?', remove_entries)
+            self.db.executemany('DELETE FROM responses WHERE key = ?', remove_responses)
+        self.db.execute('COMMIT')
+
+    def close(self):
+        if not self.disabled:
+            try:
+                self.write_accessed()
+                self.evict()
+            except sqlite3.Error as exc:
+                self.failed(exc)
+        self.db.close()
+
+    def report(self):
+        print("Component data cache: {} hits, {} misses ({})".format(self.hits, self.misses, self.path))
+
+
+class SharedCache:
+    # Component data shared by many runners through a directory (for example on NFS or a mounted volume). Each
+    # entry is a separate file named by a hash of its kind and URL (its location, not its content), written to a
+    # temporary file and renamed over any previous entry so that a partial entry is never read. Concurrent writers
+    # of the same entry race and the last rename wins (both hold data fetched from the server), and a reader racing
+    # with a rename sees the old file, the new file or an error (for example a stale NFS handle) which is treated
+    # as a miss
+    def __init__(self, cache_dir, writable=True, refresh=False):
+        if not os.path.isdir(cache_dir):
+            if not writable:
+                raise OSError("shared cache directory '{}' does not exist".format(cache_dir))
+            os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.writable = writable
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def entry_path(self, kind, url):
+        digest = hashlib.sha256(f"{kind} {url}".encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, kind, digest[:2], digest + '.json')
+
+    def get(self, kind, url):
+        # Returns the entry (with its value and the time it was stored) if it exists and has not expired
+        if not self.refresh:
+            try:
+                with open(self.entry_path(kind, url), "r") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                entry = None
+            if entry is not None and entry['url'] == url and entry['stored'] > time.time() - kind_ttls[kind]:
+                self.hits += 1
+                return entry
+        self.misses += 1
+        return None
+
+    def put(self, kind, url, value):
+        if not self.writable:
+            return
+        path = self.entry_path(kind, url)
+        tmpfile = "{}.{}.tmp".format(path, uuid.uuid4().hex)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmpfile, "w") as f:
+                json.dump({'url': url, 'stored': time.time(), 'value': value}, f)
+            os.replace(tmpfile, path)
+            self.writes += 1
+        except OSError as exc:
+            print("WARNING: Unable to write to shared cache '{}'\n".format(self.cache_dir) + str(exc))
+            self.writable = False
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+
+    def report(self):
+        print("Shared cache: {} hits, {} misses, {} written ({})".format(self.hits, self.misses, self.writes,
+                                                                          self.cache_dir))
+
+
+store = None
+shared = None
+
+
+def open_cache(cache_dir, max_size, refresh=False):
+    global store
+    try:
+        store = DataCache(cache_dir, max_size, refresh)
+    except (OSError, sqlite3.Error) as exc:
+        print("WARNING: Unable to open component data cache in '{}' - continuing without it\n".format(cache_dir) +
+              str(exc))
+        store = None
+
+
+def open_shared_cache(cache_dir, mode='rw', refresh=False):
+    global shared
+    try:
+        shared = SharedCache(cache_dir, writable=(mode == 'rw'), refresh=refresh)
+    except OSError as exc:
+        print("WARNING: Unable to open shared cache in '{}' - continuing without it\n".format(cache_dir) + str(exc))
+        shared = None
+
+
+def close_cache():
+    global store, shared
+    if store is not None:
+        store.close()
+        store = None
+    shared = None
+
+
+async def cached(kind, url, fetch):
+    # Returns the cached value for this kind of data and URL from the local cache or the shared cache, or awaits
+    # fetch() and stores the result in both
+    if store is None and shared is None:
+        return await fetch()
+    if store is not None:
+        found, value = store.get(kind, url)
+        if found:
+            return value
+    if shared is not None:
+        entry = shared.get(kind, url)
+        if entry is not None:
+            if store is not None:
+                store.put(kind, url, entry['value'], stored=entry['stored'])
+            return entry['value']
+    value = await fetch()
+    if value is not None:
+        if store is not None:
+            store.put(kind, url, value)
+        if shared is not None:
+            shared.put(kind, url, value)
+    return value
+
+
+def prune_shared(cache_dir, max_size):
+    # Remove expired entries and stale temporary files, then the oldest entries until the cache fits in max_size
+    now = time.time()
+    entries = []
+    removed = 0
+    total = 0
+    for kind in os.listdir(cache_dir):
+        kind_dir = os.path.join(cache_dir, kind)
+        if not os.path.isdir(kind_dir):
+            continue
+        ttl = kind_ttls.get(kind)
+        for root, dirs, files in os.walk(kind_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if name.endswith('.tmp'):
+                    expired = st.st_mtime < now - SHARED_TMP_AGE
+                else:
+                    expired = ttl is None or st.st_mtime < now - ttl
+                if expired:
+                    if remove_file(path):
+                        removed += 1
+                elif not name.endswith('.tmp'):
+                    entries.append((st.st_mtime, st.st_size, path))
+                    total += st.st_size
+    entries.sort()
+    for mtime, size, path in entries:
+        if total <= max_size:
+            break
+        if remove_file(path):
+            removed += 1
+        total -= size
+    return removed, total
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        # Already removed by another runner
+        return False
+
+
+def prune():
+    parser = argparse.ArgumentParser(description="Prune the shared component data cache used by bd_export_spdx",
+                                     prog='bd_export_spdx_prune_cache')
+    parser.add_argument("cache_dir", type=str, help="Shared cache directory")
+    parser.add_argument("--max_size", type=int, help="Maximum size of the shared cache in MB (default 10240)",
+                        default=10240)
+    args = parser.parse_args()
+    if not os.path.isdir(args.cache_dir):
+        print("ERROR: Shared cache directory '{}' does not exist".format(args.cache_dir))
+        sys.exit(2)
+    if args.max_size < 1:
+        print("ERROR: --max_size must be at least 1")
+        sys.exit(2)
+    removed, total = prune_shared(args.cache_dir, args.max_size * 1024 * 1024)
+    print("Removed {} entries from shared cache '{}' ({:.1f} MB remaining)".format(removed, args.cache_dir,
+                                                                                    total / (1024 * 1024)))
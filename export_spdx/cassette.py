@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+import asyncio
+import contextlib
+import gzip
+import json
+import sys
+import time
+
+import aiohttp
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+# Every HTTP exchange with the Black Duck server and Openhub can be recorded to a cassette file (--record) and
+# served back from it (--replay) so that the processing time of the export can be measured without a live server
+CASSETTE_FORMAT = 1
+
+# Response headers which are not kept in the cassette, and those kept with their value replaced
+SKIP_HEADERS = ('set-cookie',)
+REDACT_HEADERS = ('x-csrf-token',)
+
+recording = None
+replaying = None
+latency_scale = 0.0
+replayed = 0
+
+
+class CassetteMiss(Exception):
+    pass
+
+
+class ReplayResponse:
+    # Provides the parts of aiohttp.ClientResponse used by the response readers
+    def __init__(self, method, url, entry):
+        self.method = method
+        self.url = URL(url)
+        self.status = entry['status']
+        self.headers = CIMultiDictProxy(CIMultiDict(entry['headers']))
+        self.body = entry['body']
+
+    async def read(self):
+        return self.body.encode('utf-8')
+
+    async def text(self, encoding='utf-8'):
+        return self.body
+
+    async def json(self):
+        return json.loads(self.body)
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            request_info = aiohttp.RequestInfo(self.url, self.method, CIMultiDictProxy(CIMultiDict()), self.url)
+            raise aiohttp.ClientResponseError(request_info, (), status=self.status, message="Replayed response",
+                                              headers=self.headers)
+
+
+def start_recording():
+    global recording
+    recording = []
+
+
+def exchange_key(method, url, headers, params):
+    accept = ''
+    for name, value in headers.items():
+        if name.lower() == 'accept':
+            accept = value
+    return json.dumps([method, url, sorted((params or {}).items()), accept])
+
+
+def redact_headers(headers):
+    # Tokens are not written to the cassette - any value works when the exchange is replayed
+    return [[k, "REDACTED" if k.lower() in REDACT_HEADERS else v] for k, v in headers.items()
+            if k.lower() not in SKIP_HEADERS]
+
+
+def redact(url, body):
+    if not url.endswith('/api/tokens/authenticate'):
+        return body
+    try:
+        content = json.loads(body)
+    except ValueError:
+        return body
+    if isinstance(content, dict) and 'bearerToken' in content:
+        content['bearerToken'] = "REDACTED"
+    return json.dumps(content)
+
+
+@contextlib.asynccontextmanager
+async def exchange(session, method, url, headers, ssl, params=None):
+    # Used in place of session.request() for every request
+    if replaying is not None:
+        yield await replay(method, url, headers, params)
+        return
+    start = time.monotonic()
+    async with session.request(method, url, headers=headers, ssl=ssl, params=params) as resp:
+        if recording is not None:
+            # The body is kept by the response once read so the readers can still use it
+            body = (await resp.read()).decode('utf-8', 'replace')
+            recording.append({
+                'key': exchange_key(method, url, headers, params),
+                'status': resp.status,
+                'headers': redact_headers(resp.headers),
+                'body': redact(url, body),
+                'elapsed': round(time.monotonic() - start, 4),
+            })
+        yield resp
+
+
+async def replay(method, url, headers, params):
+    # Repeated requests are served the recorded responses in order, and the last one again once they run out
+    global replayed
+    key = exchange_key(method, url, headers, params)
+    entries = replaying.get(key)
+    if not entries:
+        raise CassetteMiss("No recorded response for {} {} {}".format(method, url, params or ''))
+    entry = entries.pop(0) if len(entries) > 1 else entries[0]
+    if latency_scale > 0:
+        await asyncio.sleep(entry['elapsed'] * latency_scale)
+    replayed += 1
+    return ReplayResponse(method, url, entry)
+
+
+def save(filename):
+    try:
+        with gzip.open(filename, "wt", encoding="utf-8") as f:
+            json.dump({'format': CASSETTE_FORMAT, 'exchanges': recording}, f, separators=(',', ':'))
+    except OSError as exc:
+        print("ERROR: Unable to write cassette file '{}'\n".format(filename) + str(exc))
+        sys.exit(2)
+    print("Recorded {} HTTP exchanges to '{}'".format(len(recording), filename))
+
+
+def load(filename, scale=0.0):
+    global replaying, latency_scale
+    try:
+        with gzip.open(filename, "rt", encoding="utf-8") as f:
+            content = json.load(f)
+    except (OSError, ValueError) as exc:
+        print("ERROR: Unable to read cassette file '{}'\n".format(filename) + str(exc))
+        sys.exit(2)
+    if content.get('format') != CASSETTE_FORMAT:
+        print("ERROR: Cassette file '{}' was written by an incompatible version of this script".format(filename))
+        sys.exit(2)
+    replaying = {}
+    for entry in content['exchanges']:
+        replaying.setdefault(entry['key'], []).append(entry)
+    latency_scale = scale
+    print("Replaying {} HTTP exchanges from '{}'".format(len(content['exchanges']), filename))
+
+
+def report():
+    if replaying is not None:
+        print("Replayed {} HTTP exchanges".format(replayed))
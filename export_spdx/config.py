@@ -5,9 +5,85 @@ import os
 
 from export_spdx import spdx
 from export_spdx import globals
+from export_spdx import scheduler
+from export_spdx import planner
+
+# Options shared by the export and the cache warm-up commands
+common_parser = argparse.ArgumentParser(add_help=False)
+common_parser.add_argument("--download_loc",
+                           help='''Attempt to identify component download link extracted from Openhub
+                           (slows down processing - default=false)''',
+                           action='store_true')
+common_parser.add_argument("--openhub_concurrency", type=int,
+                           help="Maximum number of concurrent Openhub requests for --download_loc (default 2)",
+                           default=2)
+common_parser.add_argument("--openhub_rate", type=float,
+                           help="Maximum Openhub requests per second for --download_loc (default 1)", default=1.0)
+common_parser.add_argument("--no_copyrights",
+                           help="Do not export copyright data for components (speeds up processing - default=false)",
+                           action='store_true')
+common_parser.add_argument("--no_files",
+                           help="Do not export file data for components (speeds up processing - default=false)",
+                           action='store_true')
+common_parser.add_argument("-b", "--basic",
+                           help='''Do not export copyright, download link  or package file data (speeds up processing -
+                           same as using "--download_loc --no_copyrights --no_files")''',
+                           action='store_true')
+common_parser.add_argument("--fields", type=str,
+                           help='''Comma separated list of optional component data to export from copyrights,
+                           comments, files, homepage and supplier (default all - fields which are not listed are not
+                           requested from the server)''', default="")
+common_parser.add_argument("--blackduck_url", type=str,
+                           help="Black Duck server URL (can also be set as env. var. BLACKDUCK_URL)", default="")
+common_parser.add_argument("--blackduck_api_token", type=str,
+                           help="Black Duck API token URL (can also be set as env. var. BLACKDUCK_API_TOKEN)",
+                           default="")
+common_parser.add_argument("--blackduck_trust_certs", help="BLACKDUCK trust certs", action='store_true')
+common_parser.add_argument("--blackduck_timeout", help="BD Server requests timeout (seconds - default 15)", default=15)
+common_parser.add_argument("--blackduck_max_concurrency", type=int,
+                           help="Maximum number of concurrent BD server requests (can also be set as env. var. "
+                                "BLACKDUCK_MAX_CONCURRENCY - default 32)", default=None)
+common_parser.add_argument("--blackduck_max_connections", type=int,
+                           help="Size of the BD server connection pool (can also be set as env. var. "
+                                "BLACKDUCK_MAX_CONNECTIONS - default same as --blackduck_max_concurrency)",
+                           default=None)
+common_parser.add_argument("--blackduck_endpoint_concurrency", type=str,
+                           help='''Maximum concurrent requests per endpoint class as a comma separated list, for example
+                           "copyrights=8,matched-files=4". Classes are copyrights, comments, matched-files, licenses,
+                           component and custom-fields (can also be set as env. var. BLACKDUCK_ENDPOINT_CONCURRENCY -
+                           default 16 per class)''', default=None)
+common_parser.add_argument("--blackduck_retries", type=int,
+                           help="Maximum retries of a BD server request after a transient error (can also be set as "
+                                "env. var. BLACKDUCK_RETRIES - default 5)", default=None)
+common_parser.add_argument("--blackduck_retry_budget", type=int,
+                           help="Maximum total retries across the whole run (can also be set as env. var. "
+                                "BLACKDUCK_RETRY_BUDGET - default 1000)", default=None)
+common_parser.add_argument("--blackduck_max_rate", type=float,
+                           help="Maximum BD server requests started per second (can also be set as env. var. "
+                                "BLACKDUCK_MAX_RATE - default no limit)", default=None)
+common_parser.add_argument("--cache_dir", type=str,
+                           help="Directory for the persistent component data cache (can also be set as env. var. "
+                                "BLACKDUCK_CACHE_DIR - default '~/.cache/bd_export_spdx')", default="")
+common_parser.add_argument("--cache_size", type=int,
+                           help="Maximum size of the component data cache in MB (default 512)", default=512)
+common_parser.add_argument("--no_cache", help="Do not use the component data cache", action='store_true')
+common_parser.add_argument("--refresh",
+                           help='''Fetch all component data from the server and update the cache - cached responses
+                           are revalidated with the server rather than reused (default=false)''',
+                           action='store_true')
+common_parser.add_argument("--shared_cache", type=str,
+                           help='''Directory of a component data cache shared with other runners, for example on NFS
+                           (can also be set as env. var. BLACKDUCK_SHARED_CACHE - default none)''', default="")
+common_parser.add_argument("--shared_cache_mode", type=str, choices=['ro', 'rw'],
+                           help="Use the shared cache read-only (ro) or read-write (rw - default)", default='rw')
+common_parser.add_argument("--cache_token",
+                           help='''Store the Black Duck bearer token in the cache directory so that later runs reuse it
+                           until it expires instead of authenticating again (default=false)''', action='store_true')
+common_parser.add_argument("--debug", help="Turn on debug messages", action='store_true')
+
 
 parser = argparse.ArgumentParser(description='"Export SPDX JSON format file for the given project and version"',
-                                 prog='bd_export_spdx22_json.py')
+                                 prog='bd_export_spdx22_json.py', parents=[common_parser])
 parser.add_argument("project_name", type=str, help='Black Duck project name')
 parser.add_argument("project_version", type=str, help='Black Duck version name')
 parser.add_argument("-v", "--version", help="Print script version and exit", action='store_true')
@@ -15,20 +91,28 @@ parser.add_argument("-o", "--output", type=str,
                     help="Output SPDX file name (SPDX JSON format) - default '<proj>-<ver>.json'", default="")
 parser.add_argument("-r", "--recursive", help="Scan sub-projects within projects (default = false)",
                     action='store_true')
-parser.add_argument("--download_loc",
-                    help='''Attempt to identify component download link extracted from Openhub
-                    (slows down processing - default=false)''',
-                    action='store_true')
-parser.add_argument("--no_copyrights",
-                    help="Do not export copyright data for components (speeds up processing - default=false)",
-                    action='store_true')
-parser.add_argument("--no_files",
-                    help="Do not export file data for components (speeds up processing - default=false)",
-                    action='store_true')
-parser.add_argument("-b", "--basic",
-                    help='''Do not export copyright, download link  or package file data (speeds up processing -
-                    same as using "--download_loc --no_copyrights --no_files")''',
+parser.add_argument("--incremental", type=str,
+                    help='''Previous SPDX output file for this project version - components which have not
+                    changed since are copied from it instead of being fetched again''', default="")
+parser.add_argument("--component_digests",
+                    help='''Add a BlackDuckHub-Component-Digest external reference to each package so that the
+                    output can be used by a later --incremental export (always added with --incremental)''',
                     action='store_true')
+parser.add_argument("--save_snapshot", type=str,
+                    help='''Also write the component list, hierarchy and component data fetched from the server to
+                    this file (gzipped JSON) so that the SPDX output can be rebuilt later with --from_snapshot''',
+                    default="")
+parser.add_argument("--from_snapshot", type=str,
+                    help='''Rebuild the SPDX output from a file written by --save_snapshot without connecting to the
+                    server''', default="")
+parser.add_argument("--record", type=str,
+                    help="Record every HTTP exchange with the server and Openhub to this cassette file", default="")
+parser.add_argument("--replay", type=str,
+                    help="Serve all HTTP requests from a cassette file written by --record instead of the server",
+                    default="")
+parser.add_argument("--replay_latency", type=float,
+                    help='''Scale applied to the recorded latency of each exchange for --replay (default 0 - serve
+                    immediately, 1 - same latency as recorded)''', default=0.0)
 parser.add_argument("-x", "--exclude_ignored_components",
                     help="Exclude components marked ignored in the BOM", action='store_true')
 parser.add_argument("--modify_spdx_fields",
@@ -38,15 +122,17 @@ parser.add_argument("--modify_spdx_fields",
                     ".  This would set all package annotation annotator entries to "Organization: Acme" and all 
                     annotation types to "REVIEW".''',
                     default="")
-parser.add_argument("--blackduck_url", type=str,
-                    help="Black Duck server URL (can also be set as env. var. BLACKDUCK_URL)", default="")
-parser.add_argument("--blackduck_api_token", type=str,
-                    help="Black Duck API token URL (can also be set as env. var. BLACKDUCK_API_TOKEN)", default="")
-parser.add_argument("--blackduck_trust_certs", help="BLACKDUCK trust certs", action='store_true')
-parser.add_argument("--blackduck_timeout", help="BD Server requests timeout (seconds - default 15)", default=15)
-parser.add_argument("--debug", help="Turn on debug messages", action='store_true')
 
-args = parser.parse_args()
+# Parsed when the command starts (parse_args) rather than on import
+args = None
+
+
+def parse_args(argparser=None, argv=None):
+    global args
+    if argparser is None:
+        argparser = parser
+    args = argparser.parse_args(argv)
+    return args
 
 
 def check_params():
@@ -54,15 +140,131 @@ def check_params():
         print("Script version: " + globals.script_version)
         sys.exit(0)
 
+    if not args.exclude_ignored_components:
+        args.exclude_ignored_components = bool(os.environ.get('EXCLUDE_IGNORED_COMPONENTS'))
+    if not args.modify_spdx_fields:
+        args.modify_spdx_fields = os.environ.get('MODIFY_SPDX_FIELDS', '')
+
+    if args.save_snapshot and args.from_snapshot:
+        print("ERROR: --save_snapshot and --from_snapshot cannot be used together")
+        sys.exit(2)
+    if args.save_snapshot and args.incremental:
+        # Unchanged components are not fetched so would be missing from the snapshot
+        print("ERROR: --save_snapshot and --incremental cannot be used together")
+        sys.exit(2)
+    if args.from_snapshot and not os.path.isfile(args.from_snapshot):
+        print("ERROR: Snapshot file '{}' does not exist".format(args.from_snapshot))
+        sys.exit(2)
+    if args.record and args.replay:
+        print("ERROR: --record and --replay cannot be used together")
+        sys.exit(2)
+    if args.replay and not os.path.isfile(args.replay):
+        print("ERROR: Cassette file '{}' does not exist".format(args.replay))
+        sys.exit(2)
+    if args.replay_latency < 0:
+        print("ERROR: --replay_latency must not be negative")
+        sys.exit(2)
+
+    check_common_params(require_server=not args.from_snapshot)
+    if args.record or args.replay:
+        # Every request must go to the server (or the cassette) - responses served from the caches or revalidated
+        # with a 304 would not be in the cassette
+        args.no_cache = True
+        args.shared_cache = ''
+        args.cache_token = False
+    if args.replay:
+        # Replayed requests are not spaced out by the request rate limits - use --replay_latency to simulate the server
+        args.blackduck_max_rate = None
+        args.openhub_rate = float('inf')
+
+    if args.output == "":
+        args.output = spdx.clean_for_spdx(args.project_name + "-" + args.project_version) + ".json"
+
+    if args.incremental and not os.path.isfile(args.incremental):
+        print("ERROR: Previous SPDX file '{}' does not exist".format(args.incremental))
+        sys.exit(2)
+
+    if args.output and os.path.exists(args.output):
+        backup = backup_file(args.output)
+        if args.incremental and os.path.abspath(args.incremental) == os.path.abspath(args.output):
+            # The previous export is being replaced - read it from the backup
+            args.incremental = backup
+
+
+def check_common_params(require_server=True):
+    if not args.blackduck_url:
+        args.blackduck_url = os.environ.get('BLACKDUCK_URL', '')
+    if not args.blackduck_api_token:
+        args.blackduck_api_token = os.environ.get('BLACKDUCK_API_TOKEN', '')
+    if args.blackduck_trust_certs:
+        globals.verify = False
+
+    if args.blackduck_url == '' and require_server:
+        print('BLACKDUCK_URL not set or specified as option --blackduck_url')
+        sys.exit(2)
+
+    if args.blackduck_api_token == '' and require_server:
+        print('BLACKDUCK_API_TOKEN not set or specified as option --blackduck_api_token')
+        sys.exit(2)
+
     if args.basic:
         args.download_loc = False
         args.no_copyrights = True
         args.no_files = True
-    if args.output == "":
-        args.output = spdx.clean_for_spdx(args.project_name + "-" + args.project_version) + ".json"
+    args.fields = planner.get_fields(args.fields, args.no_copyrights, args.no_files)
 
-    if args.output and os.path.exists(args.output):
-        backup_file(args.output)
+    args.blackduck_max_concurrency = get_int_setting(args.blackduck_max_concurrency, 'BLACKDUCK_MAX_CONCURRENCY', 32)
+    args.blackduck_max_connections = get_int_setting(args.blackduck_max_connections, 'BLACKDUCK_MAX_CONNECTIONS',
+                                                     args.blackduck_max_concurrency)
+    endpoint_concurrency = os.environ.get('BLACKDUCK_ENDPOINT_CONCURRENCY')
+    if args.blackduck_endpoint_concurrency:
+        endpoint_concurrency = args.blackduck_endpoint_concurrency
+    args.blackduck_endpoint_concurrency = scheduler.parse_class_limits(endpoint_concurrency, 16)
+    args.blackduck_retries = get_int_setting(args.blackduck_retries, 'BLACKDUCK_RETRIES', 5, minimum=0)
+    args.blackduck_retry_budget = get_int_setting(args.blackduck_retry_budget, 'BLACKDUCK_RETRY_BUDGET', 1000,
+                                                  minimum=0)
+    if args.blackduck_max_rate is None and os.environ.get('BLACKDUCK_MAX_RATE'):
+        try:
+            args.blackduck_max_rate = float(os.environ.get('BLACKDUCK_MAX_RATE'))
+        except ValueError:
+            print("ERROR: BLACKDUCK_MAX_RATE must be a number (got '{}')".format(os.environ.get('BLACKDUCK_MAX_RATE')))
+            sys.exit(2)
+    if args.blackduck_max_rate is not None and args.blackduck_max_rate <= 0:
+        print("ERROR: --blackduck_max_rate must be greater than 0")
+        sys.exit(2)
+
+    if args.openhub_concurrency < 1:
+        print("ERROR: --openhub_concurrency must be at least 1")
+        sys.exit(2)
+    if args.openhub_rate <= 0:
+        print("ERROR: --openhub_rate must be greater than 0")
+        sys.exit(2)
+
+    if args.cache_dir == "":
+        args.cache_dir = os.environ.get('BLACKDUCK_CACHE_DIR', os.path.join('~', '.cache', 'bd_export_spdx'))
+    args.cache_dir = os.path.expanduser(args.cache_dir)
+    if args.shared_cache == "":
+        args.shared_cache = os.environ.get('BLACKDUCK_SHARED_CACHE', '')
+    if args.cache_size < 1:
+        print("ERROR: --cache_size must be at least 1")
+        sys.exit(2)
+
+
+def get_int_setting(argval, envname, default, minimum=1):
+    val = argval
+    if val is None:
+        val = os.environ.get(envname)
+    if val is None or val == '':
+        return default
+    try:
+        val = int(val)
+    except ValueError:
+        print("ERROR: {} must be a number (got '{}')".format(envname, val))
+        sys.exit(2)
+    if val < minimum:
+        print("ERROR: {} must be at least {}".format(envname, minimum))
+        sys.exit(2)
+    return val
 
 
 def backup_file(filename):
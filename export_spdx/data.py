@@ -1,38 +1,22 @@
 #!/usr/bin/env python
 import re
-from lxml import html
-import requests
+import json
+import functools
+import time
+import asyncio
+import itertools
 
 from export_spdx import globals
 from export_spdx import spdx
+from export_spdx import config
+from export_spdx import snapshot
 
-
-def openhub_get_download(oh_url):
-    try:
-        page = requests.get(oh_url)
-        tree = html.fromstring(page.content)
-
-        link = ""
-        enlistments = tree.xpath("//a[text()='Project Links:']//following::a[text()='Code Locations:']//@href")
-        if len(enlistments) > 0:
-            enlist_url = "https://openhub.net" + str(enlistments[0])
-            enlist_page = requests.get(enlist_url)
-            enlist_tree = html.fromstring(enlist_page.content)
-            link = enlist_tree.xpath("//tbody//tr[1]//td[1]/text()")
-
-        if len(link) > 0:
-            sp = str(link[0].split(" ")[0]).replace('\n', '')
-            #
-            # Check format
-            protocol = sp.split('://')[0]
-            if protocol in ['https', 'http', 'git']:
-                return sp
-
-    except Exception as exc:
-        print('ERROR: Cannot get openhub data\n' + str(exc))
-        return "NOASSERTION"
-
-    return "NOASSERTION"
+# Paging of list endpoints - page sizes are adjusted between PAGE_MIN and PAGE_MAX based on the first response
+PAGE_MAX = 1000
+PAGE_MIN = 100
+PAGE_TARGET_SECS = 2.0
+PAGE_TARGET_BYTES = 4 * 1024 * 1024
+PAGE_WINDOW = 8
 
 
 # 1. translate external_namespace to purl_type [and optionally, purl_namespace]
@@ -68,45 +52,57 @@ def openhub_get_download(oh_url):
 # 12. if subpath is known (i.e. golang import subpath)
 #     purl += "#{:subpath}"
 
+PYPI_NAME_RE = re.compile('[-_.]+')
+EPOCH_RE = re.compile(r'^(\d+):')
+
+
+def make_origin_parser(namespace, origin):
+    # Separator, purl prefix, whether a name with several separators is split at the first one, and whether
+    # the name is normalized as a PyPI project name
+    prefix = "pkg:" + origin['p_type']
+    if origin['p_namespace'] != '':
+        prefix += "/" + origin['p_namespace']
+    return origin['p_sep'], prefix, namespace not in ['npmjs', 'maven'], namespace == 'pypi'
+
+
+origin_parsers = {namespace: make_origin_parser(namespace, origin)
+                  for namespace, origin in spdx.spdx_origin_map.items()}
+
+
+@functools.lru_cache(maxsize=16384)
 def calculate_purl(namespace, extid):
-    if namespace in spdx.spdx_origin_map.keys():
-        ns_split = extid.split(spdx.spdx_origin_map[namespace]['p_sep'])
-        if namespace not in ['npmjs', 'maven'] and len(ns_split) > 2:  # 2
-            compid, compver = extid.split(spdx.spdx_origin_map[namespace]['p_sep'], maxsplit=1)
-        elif spdx.spdx_origin_map[namespace]['p_sep'] in extid:
-            compid, compver = extid.rsplit(spdx.spdx_origin_map[namespace]['p_sep'], maxsplit=1)
-        else:
-            compid, compver = extid, None
-
-        purl = "pkg:" + spdx.spdx_origin_map[namespace]['p_type']  # 3
-
-        if spdx.spdx_origin_map[namespace]['p_namespace'] != '':  # 4
-            purl += "/" + spdx.spdx_origin_map[namespace]['p_namespace']
-
-        if spdx.spdx_origin_map[namespace]['p_sep'] in compid:  # 5
-            purl += '/' + '/'.join(spdx.quote(s) for s in compid.split(spdx.spdx_origin_map[namespace]['p_sep']))
-        else:  # 6
-            if namespace == 'pypi':
-                purl += '/' + spdx.quote(re.sub('[-_.]+', '-', compid.lower()))
-            else:
-                purl += '/' + spdx.quote(compid)
-
-        qual = {}
-        if compver:
-            if spdx.spdx_origin_map[namespace]['p_sep'] in compver:  # 9
-                compver, qual['arch'] = compver.split(spdx.spdx_origin_map[namespace]['p_sep'])
-
-            purl += '@' + spdx.quote(re.sub("^\d+:", '', compver))  # 7
-
-            epoch_m = re.match('^(\d+):', compver)  # 10
-            if epoch_m:
-                qual['epoch'] = epoch_m[1]
-
-        if qual:
-            purl += '?' + '&'.join('='.join([k, spdx.quote(v)]) for k, v in qual.items())  # 8
-
-        return purl
-    return ''
+    if namespace not in origin_parsers:
+        return ''
+    sep, purl, split_first, pypi = origin_parsers[namespace]
+    if split_first and extid.count(sep) > 1:
+        compid, compver = extid.split(sep, maxsplit=1)
+    elif sep in extid:
+        compid, compver = extid.rsplit(sep, maxsplit=1)
+    else:
+        compid, compver = extid, None
+
+    if sep in compid:
+        purl += '/' + '/'.join(spdx.quote_name(s) for s in compid.split(sep))
+    elif pypi:
+        purl += '/' + spdx.quote_name(PYPI_NAME_RE.sub('-', compid.lower()))
+    else:
+        purl += '/' + spdx.quote_name(compid)
+
+    qual = {}
+    if compver:
+        if sep in compver:
+            compver, qual['arch'] = compver.split(sep)
+
+        purl += '@' + spdx.quote_name(EPOCH_RE.sub('', compver))
+
+        epoch_m = EPOCH_RE.match(compver)
+        if epoch_m:
+            qual['epoch'] = epoch_m[1]
+
+    if qual:
+        purl += '?' + '&'.join('='.join([k, spdx.quote_name(v)]) for k, v in qual.items())
+
+    return purl
 
 
 def get_package_supplier(comp):
@@ -125,8 +121,12 @@ def get_package_supplier(comp):
     return ''
 
 
-def get_bom_components(verdict, exclude_ignored=False):
-    comp_dict = {}
+async def iter_bom_components(verdict, exclude_ignored=False):
+    # Yields (offset, components) for each page of BOM components as soon as it arrives
+    if snapshot.offline():
+        for offset, bom_comps in snapshot.get_bom_pages(verdict):
+            yield offset, filter_bom_components(bom_comps, exclude_ignored)
+        return
     res = globals.bd.list_resources(verdict)
     # if 'components' not in res:
     if True:
@@ -138,45 +138,116 @@ def get_bom_components(verdict, exclude_ignored=False):
         }
         # res = globals.bd.get_json(thishref, headers=headers)
         # bom_comps = res['items']
-        bom_comps = get_data_paged(globals.bd, thishref, headers)
+        async for offset, bom_comps in iter_data_pages(globals.bd, thishref, headers):
+            snapshot.add_bom_page(verdict, offset, bom_comps)
+            yield offset, filter_bom_components(bom_comps, exclude_ignored)
     # else:
     #     bom_comps = globals.bd.get_resource('components', parent=ver)
+
+
+def filter_bom_components(bom_comps, exclude_ignored):
+    comps = []
     for comp in bom_comps:
         if 'componentVersion' not in comp:
             continue
         if 'ignored' in comp and exclude_ignored and comp['ignored']:
             continue
-        compver = comp['componentVersion']
+        comps.append(comp)
+    return comps
+
+
+async def get_bom_components(verdict, exclude_ignored=False):
+    pages = {}
+    async for offset, comps in iter_bom_components(verdict, exclude_ignored):
+        pages[offset] = comps
+    return comps_by_version(pages)
+
+
+def comps_by_version(pages):
+    comp_dict = {}
+    for offset in sorted(pages.keys()):
+        for comp in pages[offset]:
+            compver = comp['componentVersion']
 
-        comp_dict[compver] = comp
+            comp_dict[compver] = comp
 
     return comp_dict
 
 
-def get_data_paged(bd, dataurl, headers):
-    bucket = 1000
-    pageurl = f"{dataurl}?limit={bucket}"
-
-    # try:
-    #     resp = bd.get_json(pageurl, headers=headers)
-    #     total = resp['totalCount']
-    #     alldata = resp['items']
-    #     offset = bucket
-    #     while len(alldata) < total:
-    #         resp = bd.get_json(f"{pageurl}&offset={offset}", headers=headers)
-    #         alldata += resp['items']
-    #         offset += bucket
-    # except Exception as e:
-    #     print(f"ERROR: Unable to get paged data from {dataurl}\n" + str(e))
-    #     return []
-    # return alldata
-
-    resp = bd.get_json(pageurl, headers=headers)
+async def get_hierarchical_bom(verdict, fallback=False):
+    res = globals.bd.list_resources(verdict)
+    if 'hierarchical-components' in res:
+        return await get_data_paged(globals.bd, res['hierarchical-components'], {})
+    elif fallback:
+        headers = {
+            'accept': "application/vnd.blackducksoftware.bill-of-materials-6+json",
+        }
+        return await get_data_paged(globals.bd, res['href'] + "/hierarchical-components", headers)
+    return []
+
+
+async def fetch_page(bd, dataurl, headers, params):
+    start_time = time.time()
+    # Raw page text is not kept by the client, the parsed items are returned to the caller
+    text = await bd.get_text(dataurl, headers=headers, params=params, share=False)
+    return json.loads(text), time.time() - start_time, len(text)
+
+
+def choose_page_size(count, elapsed, size):
+    # Size later pages so each one takes roughly PAGE_TARGET_SECS and PAGE_TARGET_BYTES, which keeps slow or
+    # very large responses spread across the concurrent window
+    if count == 0:
+        return PAGE_MAX
+    page_size = PAGE_MAX
+    if elapsed > 0:
+        page_size = min(page_size, int(PAGE_TARGET_SECS * count / elapsed))
+    if size > 0:
+        page_size = min(page_size, int(PAGE_TARGET_BYTES * count / size))
+    page_size = max(PAGE_MIN, page_size - page_size % PAGE_MIN)
+    return page_size
+
+
+async def iter_data_pages(bd, dataurl, headers, bucket=PAGE_MAX):
+    # Yields (offset, items) for each page as soon as it arrives - pages after the first are fetched concurrently
+    # and may be returned out of order
+    resp, elapsed, size = await fetch_page(bd, dataurl, headers, {'limit': bucket})
     total = resp['totalCount']
-    alldata = resp['items']
-    offset = bucket
-    while len(alldata) < total:
-        resp = bd.get_json(f"{pageurl}&offset={offset}", headers=headers)
-        alldata += resp['items']
-        offset += bucket
+    items = resp['items']
+    yield 0, items
+
+    if len(items) == 0 or len(items) >= total:
+        return
+
+    page_size = choose_page_size(len(items), elapsed, size)
+    window = min(PAGE_WINDOW, config.args.blackduck_max_concurrency)
+    if config.args.debug:
+        print("Fetching {} remaining items from {} in pages of {}".format(total - len(items), dataurl, page_size))
+
+    offsets = iter(range(len(items), total, page_size))
+    pending = {}
+    try:
+        for offset in itertools.islice(offsets, window):
+            params = {'limit': page_size, 'offset': offset}
+            pending[asyncio.ensure_future(fetch_page(bd, dataurl, headers, params))] = offset
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                offset = pending.pop(future)
+                resp, elapsed, size = future.result()
+                for next_offset in itertools.islice(offsets, 1):
+                    params = {'limit': page_size, 'offset': next_offset}
+                    pending[asyncio.ensure_future(fetch_page(bd, dataurl, headers, params))] = next_offset
+                yield offset, resp['items']
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+async def get_data_paged(bd, dataurl, headers):
+    pages = {}
+    async for offset, items in iter_data_pages(bd, dataurl, headers):
+        pages[offset] = items
+    alldata = []
+    for offset in sorted(pages.keys()):
+        alldata += pages[offset]
     return alldata
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+import hashlib
+import json
+
+from export_spdx import globals
+from export_spdx import config
+from export_spdx import cache
+from export_spdx import spdx
+from export_spdx import incremental
+
+# Rendered packages are kept in the component data cache as serialized JSON, keyed by component version together
+# with a hash of everything the package is rendered from (including the options), so that an unchanged component is
+# neither rendered nor encoded again. The BOM entry differs between project versions, so each project version using a
+# component has its own entry. Annotation dates are the time of the export so are stored as a placeholder
+DATE_PLACEHOLDER = '"annotationDate": "@ANNOTATION_DATE@"'
+
+hits = 0
+misses = 0
+
+
+def enabled():
+    # Fields changed by --modify_spdx_fields are edited in the package dicts, so packages are not serialized early
+    return cache.store is not None and not config.args.modify_spdx_fields
+
+
+def annotation_date(comp_data):
+    # All annotations for a component share the same date - None if there are none (or they differ)
+    dates = set(annotation['annotationDate'] for annotation in comp_data['comments'])
+    if len(dates) == 1:
+        return dates.pop()
+    return None
+
+
+def fragment_key(bomentry, comp_data):
+    data = dict(comp_data)
+    data['comments'] = [dict(annotation, annotationDate='') for annotation in comp_data['comments']]
+    content = json.dumps([bomentry, data, config.args.fields, config.args.download_loc, globals.script_version],
+                         sort_keys=True)
+    key = bomentry['componentVersion'] + ' ' + hashlib.sha256(content.encode('utf-8')).hexdigest()
+    # Packages with a digest reference (--component_digests) are kept separately from those without
+    if incremental.digests_enabled():
+        key += ' digest'
+    return key
+
+
+def get(bomentry, comp_data):
+    # Returns (package, extracted licenses) for a cached package rendered from the same data, otherwise None
+    global hits, misses
+    date = annotation_date(comp_data)
+    if len(comp_data['comments']) > 0 and date is None:
+        return None
+    found, value = cache.store.get('packages', fragment_key(bomentry, comp_data))
+    if not found:
+        misses += 1
+        return None
+    hits += 1
+    text = value[0]
+    if date is not None:
+        text = text.replace(DATE_PLACEHOLDER, '"annotationDate": ' + json.dumps(date))
+    return spdx.RenderedPackage(text), value[1]
+
+
+def put(bomentry, comp_data, package, extracted):
+    # Returns the serialized package after storing it in the cache
+    rendered = spdx.render_package(package)
+    date = annotation_date(comp_data)
+    if len(comp_data['comments']) > 0 and date is None:
+        return rendered
+    text = rendered
+    if date is not None:
+        text = text.replace('"annotationDate": ' + json.dumps(date), DATE_PLACEHOLDER)
+    cache.store.put('packages', fragment_key(bomentry, comp_data), [text, extracted])
+    return rendered
+
+
+def report():
+    print("Package fragment cache: {} hits, {} misses".format(hits, misses))
@@ -1,8 +1,8 @@
 #!/usr/bin/env python
 script_version = "0.23"
 
-processed_comp_list = []
-spdx_lics = []
+# Endpoint classes used to limit concurrent requests during component data enrichment
+endpoint_classes = ['copyrights', 'comments', 'matched-files', 'licenses', 'component', 'custom-fields']
 
 # The name of a custom attribute which should override the default package supplier
 SBOM_CUSTOM_SUPPLIER_NAME = "PackageSupplier"
@@ -36,15 +36,21 @@ matchtype_contains_dict = {
     "SNIPPET": "OTHER",
 }
 
-spdx = dict()
-spdx['packages'] = []
-spdx['relationships'] = []
-spdx['snippets'] = []
-spdx['hasExtractedLicensingInfos'] = []
+# Relationship type for each set of match types (see process.get_relationship_type)
+matchtype_relationships = {}
 
-spdx_ids = {}
+# SPDX document being built (sbom.SBOM)
+sbom = None
+
+# Custom license text for each license ID fetched in this run (as tasks, so concurrent components share the request)
+lic_texts = {}
+
+# Relationships and component count for each hierarchical subtree walked, keyed by (componentVersion, children href)
+hier_subtrees = {}
+subtree_replays = 0
 proj_list = []
 
 verify = True
 
 bd = None
+openhub = None
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+import hashlib
+import json
+import re
+
+from export_spdx import globals
+from export_spdx import config
+
+# Extra externalRef recording the BOM entry (including its update timestamps) and options each package was rendered
+# from, so that a later --incremental export can tell whether the component has changed before fetching its data.
+# Only added with --component_digests (or --incremental, so that the output can be used by the next incremental export)
+DIGEST_REF_TYPE = "BlackDuckHub-Component-Digest"
+
+prev_packages = {}
+prev_licenses = {}
+prev_relationships = []
+prev_order = []
+reused = set()
+
+
+def load(filename, version):
+    # Index the packages of a previous export of this project version by component version URL
+    global prev_relationships
+    try:
+        with open(filename, "r") as f:
+            prev = json.load(f)
+    except (OSError, ValueError) as exc:
+        print("WARNING: Unable to read previous SPDX file '{}' - exporting all components\n".format(filename) +
+              str(exc))
+        return
+    if prev.get('documentNamespace') != version['_meta']['href']:
+        print("WARNING: Previous SPDX file '{}' is not an export of this project version - exporting all "
+              "components".format(filename))
+        return
+
+    for package in prev.get('packages', []):
+        refs = {ref['referenceType']: ref['referenceLocator'] for ref in package.get('externalRefs', [])}
+        if 'BlackDuckHub-Component-Version' in refs and DIGEST_REF_TYPE in refs:
+            cver = refs['BlackDuckHub-Component-Version']
+            prev_packages[cver] = (refs[DIGEST_REF_TYPE], package)
+            prev_order.append(cver)
+    for lic in prev.get('hasExtractedLicensingInfos', []):
+        prev_licenses[lic['licenseID']] = lic
+    prev_relationships = [reln for reln in prev.get('relationships', [])
+                          if reln['spdxElementId'] != "SPDXRef-DOCUMENT"]
+    print("Loaded {} packages from previous SPDX file '{}'".format(len(prev_packages), filename))
+
+
+def loaded():
+    return len(prev_packages) > 0
+
+
+def digests_enabled():
+    return config.args.component_digests or bool(config.args.incremental)
+
+
+def comp_digest(comp):
+    # Changes to the BOM entry or to the selected options invalidate the previous package. Data fetched from other
+    # endpoints (copyrights, comments, matched files, license texts, homepage and supplier) is not covered, so that
+    # unchanged components need no requests at all
+    content = json.dumps([comp, config.args.fields, config.args.download_loc, globals.script_version],
+                         sort_keys=True)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def digest_ref(comp):
+    return {
+        "referenceCategory": "OTHER",
+        "referenceType": DIGEST_REF_TYPE,
+        "referenceLocator": comp_digest(comp)
+    }
+
+
+def get_package(comp):
+    # Returns the package from the previous export if the component has not changed since, otherwise None
+    if comp['componentVersion'] not in prev_packages:
+        return None
+    digest, package = prev_packages[comp['componentVersion']]
+    if digest != comp_digest(comp):
+        return None
+    return package
+
+
+def copy_package(cver):
+    # Reuse a previous package together with the extracted license texts it refers to
+    digest, package = prev_packages[cver]
+    globals.sbom.set_package(cver, package)
+    reused.add(cver)
+    for field in ['licenseConcluded', 'licenseDeclared']:
+        for licref in re.findall(r"LicenseRef-[^\s()]+", package.get(field, '')):
+            if licref in prev_licenses:
+                globals.sbom.add_license(prev_licenses[licref])
+
+
+def unchanged(compsdict):
+    # True if the BOM holds exactly the components of the previous export and all of them were reused
+    return set(prev_packages.keys()) == set(compsdict.keys()) and reused.issuperset(compsdict.keys())
+
+
+def copy_document():
+    # Claim the package names in their previous order and copy all packages and relationships
+    for cver in prev_order:
+        digest, package = prev_packages[cver]
+        globals.sbom.claim(package['SPDXID'], cver)
+        copy_package(cver)
+    for reln in prev_relationships:
+        globals.sbom.graph.add(reln['spdxElementId'], reln['relationshipType'], reln['relatedSpdxElement'])
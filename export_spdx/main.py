@@ -1,92 +1,127 @@
 #!/usr/bin/env python
 import logging
 import sys
-import os
 import datetime
+import asyncio
+import platform
 
-from blackduck import Client
 from export_spdx import globals
 from export_spdx import spdx
 from export_spdx import config
 from export_spdx import process
 from export_spdx import projects
+from export_spdx import retry
+from export_spdx import bdclient
+from export_spdx import cache
+from export_spdx import incremental
+from export_spdx import openhub
+from export_spdx import snapshot
+from export_spdx import cassette
+from export_spdx import fragments
+from export_spdx import sbom
+from export_spdx import licenses
 
 logging.basicConfig(format='%(asctime)s:%(levelname)s:%(message)s', stream=sys.stderr, level=logging.INFO)
-logging.getLogger("requests").setLevel(logging.INFO)
 logging.getLogger("urllib3").setLevel(logging.INFO)
 
-url = os.environ.get('BLACKDUCK_URL')
-if config.args.blackduck_url:
-    url = config.args.blackduck_url
-
-api = os.environ.get('BLACKDUCK_API_TOKEN')
-if config.args.blackduck_api_token:
-    api = config.args.blackduck_api_token
-
-exclude_ignored_components = os.environ.get('EXCLUDE_IGNORED_COMPONENTS')
-if config.args.exclude_ignored_components:
-    exclude_ignored_components = config.args.exclude_ignored_components
-
-modify_spdx_fields = os.environ.get('MODIFY_SPDX_FIELDS')
-if config.args.modify_spdx_fields:
-    modify_spdx_fields = config.args.modify_spdx_fields
-
-if config.args.blackduck_trust_certs:
-    globals.verify = False
-
-if url == '' or url is None:
-    print('BLACKDUCK_URL not set or specified as option --blackduck_url')
-    sys.exit(2)
-
-if api == '' or api is None:
-    print('BLACKDUCK_API_TOKEN not set or specified as option --blackduck_api_token')
-    sys.exit(2)
-
-globals.bd = Client(
-    token=api,
-    base_url=url,
-    verify=globals.verify,  # TLS certificate verification
-    timeout=config.args.blackduck_timeout
-)
-
 
 def run():
     print("BLACK DUCK SPDX EXPORT SCRIPT VERSION {}\n".format(globals.script_version))
 
+    config.parse_args()
     config.check_params()
+    retry.configure(config.args.blackduck_retries, config.args.blackduck_retry_budget)
+    if config.args.from_snapshot:
+        snapshot.load(config.args.from_snapshot)
+    elif config.args.save_snapshot:
+        snapshot.start_recording()
+    if config.args.replay:
+        cassette.load(config.args.replay, config.args.replay_latency)
+    elif config.args.record:
+        cassette.start_recording()
+
+    if platform.system() == "Windows":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(async_run(export_project))
+    if config.args.record:
+        cassette.save(config.args.record)
+
+    if config.args.debug and globals.bd is not None:
+        globals.bd.report()
+    retry.policy.report(config.args.debug)
+    snapshot.report()
+    cassette.report()
+
+
+async def async_run(command):
+    # Runs the command with the caches open and a single Black Duck client
+    if not config.args.no_cache:
+        cache.open_cache(config.args.cache_dir, config.args.cache_size * 1024 * 1024, config.args.refresh)
+    if config.args.shared_cache:
+        cache.open_shared_cache(config.args.shared_cache, config.args.shared_cache_mode, config.args.refresh)
+    globals.openhub = openhub.OpenHubClient(config.args.openhub_concurrency, config.args.openhub_rate)
+    try:
+        if snapshot.offline():
+            # Everything comes from the snapshot (--from_snapshot) so no server connection is made
+            await command()
+        else:
+            async with bdclient.get_client():
+                await command()
+    finally:
+        await globals.openhub.close()
+        if config.args.debug and cache.store is not None:
+            cache.store.report()
+            fragments.report()
+        if config.args.debug and cache.shared is not None:
+            cache.shared.report()
+        cache.close_cache()
+
+
+async def export_project():
+    if snapshot.offline():
+        project, version = snapshot.get_project(config.args.project_name, config.args.project_version)
+        globals.proj_list = snapshot.get_proj_list()
+    else:
+        if config.args.recursive:
+            # Project list is only needed later to recognise sub-projects
+            projlist_task = asyncio.ensure_future(projects.get_all_projects())
 
-    project, version = projects.check_projver(config.args.project_name, config.args.project_version)
+        project, version = await projects.check_projver(config.args.project_name, config.args.project_version)
     print("Working on project '{}' version '{}'\n".format(project['name'], version['versionName']))
 
-    bearer_token = globals.bd.session.auth.bearer_token
+    if config.args.incremental:
+        incremental.load(config.args.incremental, version)
 
-    if config.args.recursive:
-        globals.proj_list = projects.get_all_projects()
+    if config.args.recursive and not snapshot.offline():
+        globals.proj_list = await projlist_task
+    snapshot.add_project(project, version, globals.proj_list)
 
+    globals.sbom = sbom.SBOM()
+    globals.lic_texts = {}
     globals.spdx_custom_lics = []
 
     toppackage = spdx.clean_for_spdx("SPDXRef-Package-" + project['name'] + "-" + version['versionName'])
     mytime = datetime.datetime.now()
 
     # Define TOP Document entries
-    globals.spdx["SPDXID"] = "SPDXRef-DOCUMENT"
-    globals.spdx["spdxVersion"] = "SPDX-2.2"
-    globals.spdx["creationInfo"] = {
+    globals.sbom.doc["SPDXID"] = "SPDXRef-DOCUMENT"
+    globals.sbom.doc["spdxVersion"] = "SPDX-2.2"
+    globals.sbom.doc["creationInfo"] = {
         # "created": spdx.quote(version['createdAt'].split('.')[0] + 'Z'),
         "created": spdx.quote(mytime.strftime("%Y-%m-%dT%H:%M:%S.%fZ")),
         "creators": ["Tool: Black Duck SPDX export script https://github.com/matthewb66/bd_export_spdx2.2"],
         "licenseListVersion": "3.9",
     }
     if 'description' in project.keys():
-        globals.spdx["creationInfo"]["comment"] = spdx.quote(project['description'])
-    globals.spdx["name"] = spdx.quote(project['name'] + '/' + version['versionName'])
-    globals.spdx["dataLicense"] = "CC0-1.0"
-    globals.spdx["documentDescribes"] = [toppackage]
-    globals.spdx["documentNamespace"] = version['_meta']['href']
-    globals.spdx["downloadLocation"] = "NOASSERTION"
-    globals.spdx["filesAnalyzed"] = False
-    globals.spdx["copyrightText"] = "NOASSERTION"
-    globals.spdx["externalRefs"] = [
+        globals.sbom.doc["creationInfo"]["comment"] = spdx.quote(project['description'])
+    globals.sbom.doc["name"] = spdx.quote(project['name'] + '/' + version['versionName'])
+    globals.sbom.doc["dataLicense"] = "CC0-1.0"
+    globals.sbom.doc["documentDescribes"] = [toppackage]
+    globals.sbom.doc["documentNamespace"] = version['_meta']['href']
+    globals.sbom.doc["downloadLocation"] = "NOASSERTION"
+    globals.sbom.doc["filesAnalyzed"] = False
+    globals.sbom.doc["copyrightText"] = "NOASSERTION"
+    globals.sbom.doc["externalRefs"] = [
                 {
                     "referenceCategory": "OTHER",
                     "referenceType": "BlackDuckHub-Project",
@@ -131,25 +166,28 @@ def run():
             projpkg["licenseDeclared"] = "NOASSERTION"
         else:
             projpkg["licenseDeclared"] = version['license']['licenseDisplay']
-    globals.spdx['packages'].append(projpkg)
-
-    if 'hierarchical-components' in globals.bd.list_resources(version):
-        hierarchical_bom = globals.bd.get_resource('hierarchical-components', parent=version)
-    else:
-        hierarchical_bom = []
+    globals.sbom.add_package(projpkg)
 
-    process.process_project(project, version, toppackage, hierarchical_bom, bearer_token, exclude_ignored_components)
+    await process.process_project(project, version, toppackage, config.args.exclude_ignored_components)
 
     print("Done")
+    if config.args.debug:
+        globals.sbom.report()
+        licenses.report()
 
     # deal with filtering out certain fields from the final output based on command line input
-    if modify_spdx_fields is not None and modify_spdx_fields != '':
-        modification_instructions = modify_spdx_fields.split(',')
+    if config.args.modify_spdx_fields:
+        modification_instructions = config.args.modify_spdx_fields.split(',')
         modification_instructions = [string.strip() for string in modification_instructions]
     else:
         modification_instructions = []
 
-    entrypoint = globals.spdx
+    entrypoint = globals.sbom.doc
+    lists = globals.sbom.lists()
+    if len(modification_instructions) > 0:
+        # The instructions are applied to the package and relationship dicts so the whole document is built
+        entrypoint = globals.sbom.document()
+        lists = None
 
     def search_and_remove(json_object, levels, val):
         level = levels[0]
@@ -173,7 +211,9 @@ def run():
         search_and_remove(entrypoint, fields, modified_value)
 
     # write the result to the file system
-    spdx.write_spdx_file(globals.spdx)
+    spdx.write_spdx_file(entrypoint, lists)
+    if config.args.save_snapshot:
+        snapshot.save(config.args.save_snapshot)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+import asyncio
+import time
+import urllib.parse
+
+import aiohttp
+from lxml import html
+
+from export_spdx import cache
+from export_spdx import retry
+
+OPENHUB_TIMEOUT = 30
+
+
+class OpenHubClient:
+    # Looks up component download locations from openhub.net project pages - requests are limited to a few at a
+    # time and a maximum rate so that large BOMs do not flood the site
+    def __init__(self, concurrency=2, rate=1.0):
+        self.concurrency = concurrency
+        self.interval = 1.0 / rate
+        self.session = None
+        self.semaphore = None
+        self.rate_lock = None
+        self.next_start = 0.0
+        self.requests = 0
+
+    def open(self):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.rate_lock = asyncio.Lock()
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.concurrency),
+                                             timeout=aiohttp.ClientTimeout(total=OPENHUB_TIMEOUT))
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def get_page(self, url):
+        if self.session is None:
+            self.open()
+        async with self.semaphore:
+            async with self.rate_lock:
+                # Space out the start of requests to the configured rate
+                now = time.monotonic()
+                if self.next_start > now:
+                    await asyncio.sleep(self.next_start - now)
+                self.next_start = max(now, self.next_start) + self.interval
+            self.requests += 1
+            return await retry.async_request(self.session, 'GET', url, {}, None, reader=retry.read_text)
+
+    async def get_download(self, oh_url):
+        # Download locations rarely change so the result for each OpenHub project is cached for a long time
+        download = await cache.cached('openhub', oh_url, lambda: self.fetch_download(oh_url))
+        if download is None:
+            return "NOASSERTION"
+        return download
+
+    async def fetch_download(self, oh_url):
+        try:
+            tree = html.fromstring(await self.get_page(oh_url))
+
+            link = ""
+            enlistments = tree.xpath("//a[text()='Project Links:']//following::a[text()='Code Locations:']//@href")
+            if len(enlistments) > 0:
+                enlist_url = urllib.parse.urljoin(oh_url, str(enlistments[0]))
+                enlist_tree = html.fromstring(await self.get_page(enlist_url))
+                link = enlist_tree.xpath("//tbody//tr[1]//td[1]/text()")
+
+            if len(link) > 0:
+                sp = str(link[0].split(" ")[0]).replace('\n', '')
+                #
+                # Check format
+                protocol = sp.split('://')[0]
+                if protocol in ['https', 'http', 'git']:
+                    return sp
+
+        except aiohttp.ClientResponseError as exc:
+            if exc.status == 404:
+                # No such OpenHub project
+                return "NOASSERTION"
+            print('ERROR: Cannot get openhub data\n' + str(exc))
+            return None
+        except Exception as exc:
+            # Not cached so that the lookup is tried again in the next export
+            print('ERROR: Cannot get openhub data\n' + str(exc))
+            return None
+
+        return "NOASSERTION"
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+import asyncio
+
+
+class Pipeline:
+    # Streams components through enrichment and rendering - workers fetch the data for one component at a time and
+    # pass it to a single renderer as soon as it is complete. Both queues are bounded so that the producer is held
+    # back (rather than buffering the whole BOM) when enrichment or rendering falls behind
+    def __init__(self, enrich, render, workers, queue_size):
+        self.enrich = enrich
+        self.render = render
+        self.num_workers = workers
+        self.work_queue = asyncio.Queue(maxsize=queue_size)
+        self.render_queue = asyncio.Queue(maxsize=queue_size)
+        self.queued = set()
+        self.workers = []
+        self.renderer = None
+        self.error = None
+        self.rendered = 0
+
+    def start(self):
+        for i in range(self.num_workers):
+            self.workers.append(asyncio.ensure_future(self.worker()))
+        self.renderer = asyncio.ensure_future(self.render_loop())
+
+    async def put(self, comp):
+        # Each component version is only enriched once
+        cver = comp['componentVersion']
+        if cver in self.queued:
+            return
+        self.queued.add(cver)
+        await self.work_queue.put(comp)
+
+    async def finish(self):
+        for worker in self.workers:
+            await self.work_queue.put(None)
+        await asyncio.gather(*self.workers)
+        await self.render_queue.put(None)
+        await self.renderer
+        if self.error is not None:
+            raise self.error
+
+    async def worker(self):
+        while True:
+            comp = await self.work_queue.get()
+            if comp is None:
+                return
+            if self.error is not None:
+                # Keep draining the queue after a failure so that the producer is not blocked
+                continue
+            try:
+                comp_data = await self.enrich(comp)
+            except Exception as exc:
+                self.error = exc
+                continue
+            await self.render_queue.put((comp, comp_data))
+
+    async def render_loop(self):
+        while True:
+            item = await self.render_queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue
+            comp, comp_data = item
+            try:
+                self.render(comp, comp_data)
+                self.rendered += 1
+            except Exception as exc:
+                self.error = exc
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+import sys
+
+from export_spdx import config
+
+# Optional component data fields and the endpoint class used to fetch each of them
+field_endpoints = {
+    'copyrights': 'copyrights',
+    'comments': 'comments',
+    'files': 'matched-files',
+    'homepage': 'component',
+    'supplier': 'custom-fields',
+}
+
+
+def get_fields(fields_str, no_copyrights=False, no_files=False):
+    if fields_str is None or fields_str == '':
+        fields = list(field_endpoints.keys())
+    else:
+        fields = []
+        for field in fields_str.split(','):
+            field = field.strip()
+            if field == '':
+                continue
+            if field not in field_endpoints:
+                print("ERROR: Unknown field '{}' in --fields (valid fields are {})".format(
+                    field, ', '.join(field_endpoints.keys())))
+                sys.exit(2)
+            if field not in fields:
+                fields.append(field)
+
+    if no_copyrights and 'copyrights' in fields:
+        fields.remove('copyrights')
+    if no_files and 'files' in fields:
+        fields.remove('files')
+    return fields
+
+
+def wants(field):
+    return field in config.args.fields
+
+
+def get_link(hrefs, rel):
+    return next((item for item in hrefs if item["rel"] == rel), None)
+
+
+def plan_requests(compsdict, lic_refs, comp_urls=None):
+    # Count the requests needed for the selected fields - requests for the same URL are only made once, so the
+    # component URLs already planned (for earlier pages of the component list) are passed in and added to comp_urls
+    if comp_urls is None:
+        comp_urls = set()
+    planned = len(comp_urls)
+    counts = {}
+    for field, epclass in field_endpoints.items():
+        if wants(field):
+            counts[epclass] = 0
+    counts['licenses'] = len(lic_refs)
+    if config.args.download_loc:
+        counts['openhub'] = 0
+
+    for comp in compsdict.values():
+        hrefs = comp['_meta']['links']
+        if wants('copyrights') and len(comp['origins']) > 0:
+            counts['copyrights'] += 1
+        if wants('comments') and get_link(hrefs, 'comments'):
+            counts['comments'] += 1
+        if wants('files') and get_link(hrefs, 'matched-files'):
+            counts['matched-files'] += 1
+        if wants('homepage') and 'component' in comp.keys():
+            comp_urls.add(comp['component'])
+        if wants('supplier') and get_link(hrefs, 'custom-fields'):
+            counts['custom-fields'] += 1
+        if config.args.download_loc and get_link(hrefs, 'openhub'):
+            # Project page and code locations page
+            counts['openhub'] += 2
+    if wants('homepage'):
+        counts['component'] = len(comp_urls) - planned
+    return counts
+
+
+def report(counts, num_comps):
+    print("Planned component data requests for {} components: {} ({})".format(
+        num_comps, sum(counts.values()), ', '.join("{}={}".format(k, v) for k, v in counts.items())))
@@ -1,177 +1,236 @@
 #!/usr/bin/env python
 import datetime
 import re
-import aiohttp
 import asyncio
 import time
-import platform
 
 from export_spdx import globals
 from export_spdx import spdx
 from export_spdx import config
 from export_spdx import projects
 from export_spdx import data
-
-
-def process_comp(comps_dict, tcomp, comp_data_dict):
+from export_spdx import planner
+from export_spdx import pipeline
+from export_spdx import cache
+from export_spdx import incremental
+from export_spdx import snapshot
+from export_spdx import fragments
+from export_spdx import sbom
+from export_spdx import licenses
+
+
+async def process_comp(comps_dict, tcomp, pipe):
+    # Claims the SPDX package name for this component version - the package itself is rendered by the pipeline
     cver = tcomp['componentVersion']
-    if cver in comps_dict.keys():
-        # ind = compverlist.index(tcomp['componentVersion'])
-        bomentry = comps_dict[cver]
-    else:
-        bomentry = tcomp
-
     spdxpackage_name = spdx.clean_for_spdx(
         "SPDXRef-Package-" + tcomp['componentName'] + "-" + tcomp['componentVersionName'])
 
-    if spdxpackage_name in globals.spdx_ids:
+    if not globals.sbom.claim(spdxpackage_name, cver):
         return spdxpackage_name
 
-    globals.spdx_ids[spdxpackage_name] = 1
+    if cver not in comps_dict.keys():
+        # Not in the BOM component list (for example an excluded ignored component) so needs its own data
+        if not copy_unchanged(tcomp):
+            await pipe.put(tcomp)
+    return spdxpackage_name
 
-    # openhub_url = None
 
-    if cver not in globals.processed_comp_list:
-        download_url = "NOASSERTION"
+def copy_unchanged(comp):
+    # Components unchanged since the previous export (--incremental) are copied without fetching their data
+    if incremental.get_package(comp) is None:
+        return False
+    incremental.copy_package(comp['componentVersion'])
+    return True
 
-        # fcomp = globals.bd.get_json(tcomp['component'])  # CHECK THIS
-        #
-        openhub_url = next((item for item in bomentry['_meta']['links'] if item["rel"] == "openhub"), None)
-        if config.args.download_loc and openhub_url is not None:
-            download_url = data.openhub_get_download(openhub_url['href'])
 
-        copyrights = "NOASSERTION"
-        # cpe = "NOASSERTION"
-        pkg = "NOASSERTION"
-        if not config.args.no_copyrights:
-            # copyrights, cpe, pkg = get_orig_data(bomentry)
-            copyrights = comp_data_dict[cver]['copyrights']
+def render_comp(bomentry, comp_data):
+    cver = bomentry['componentVersion']
+    spdxpackage_name = spdx.clean_for_spdx(
+        "SPDXRef-Package-" + bomentry['componentName'] + "-" + bomentry['componentVersionName'])
 
-            if 'origins' in bomentry.keys() and len(bomentry['origins']) > 0:
-                orig = bomentry['origins'][0]
-                if 'externalNamespace' in orig.keys() and 'externalId' in orig.keys():
-                    pkg = data.calculate_purl(orig['externalNamespace'], orig['externalId'])
+    download_url = "NOASSERTION"
 
-        package_file = "NOASSERTION"
-        if not config.args.no_files:
-            package_file = comp_data_dict[cver]['files']
+    # fcomp = globals.bd.get_json(bomentry['component'])  # CHECK THIS
+    #
+    openhub_url = next((item for item in bomentry['_meta']['links'] if item["rel"] == "openhub"), None)
+    if config.args.download_loc and openhub_url is not None:
+        download_url = comp_data['download']
 
-        desc = 'NOASSERTION'
-        if 'description' in tcomp.keys():
-            desc = re.sub("[^a-zA-Z.()\d\s\-:]", '', bomentry['description'])
+    copyrights = "NOASSERTION"
+    # cpe = "NOASSERTION"
+    pkg = "NOASSERTION"
+    if planner.wants('copyrights'):
+        # copyrights, cpe, pkg = get_orig_data(bomentry)
+        copyrights = comp_data['copyrights']
 
-        annotations = comp_data_dict[cver]['comments']
-        lic_string = comp_data_dict[cver]['licenses']
+        if 'origins' in bomentry.keys() and len(bomentry['origins']) > 0:
+            orig = bomentry['origins'][0]
+            if 'externalNamespace' in orig.keys() and 'externalId' in orig.keys():
+                pkg = data.calculate_purl(orig['externalNamespace'], orig['externalId'])
 
-        component_package_supplier = ''
+    package_file = "NOASSERTION"
+    if planner.wants('files'):
+        package_file = comp_data['files']
 
-        # homepage = 'NOASSERTION'
-        homepage = comp_data_dict[cver]['url']
+    desc = 'NOASSERTION'
+    if 'description' in bomentry.keys():
+        desc = re.sub("[^a-zA-Z.()\d\s\-:]", '', bomentry['description'])
 
-        bom_package_supplier = comp_data_dict[cver]['supplier']
+    annotations = comp_data['comments']
+    extracted = []
+    lic_string = get_licenses(bomentry, comp_data['lic_texts'], extracted)
 
-        packageinfo = "This is a"
+    component_package_supplier = ''
 
-        if bomentry['componentType'] == 'CUSTOM_COMPONENT':
-            packageinfo = packageinfo + " custom component"
-        if bomentry['componentType'] == 'SUB_PROJECT':
-            packageinfo = packageinfo + " sub project"
-        else:
-            packageinfo = packageinfo + "n open source component from the Black Duck Knowledge Base"
-
-        if len(bomentry['matchTypes']) > 0:
-            firstType = bomentry['matchTypes'][0]
-            if firstType == 'MANUAL_BOM_COMPONENT':
-                packageinfo = packageinfo + " which was manually added"
-            else:
-                packageinfo = packageinfo + " which was automatically detected"
-                if firstType == 'FILE_EXACT':
-                    packageinfo = packageinfo + " as a direct file match"
-                elif firstType == 'SNIPPET':
-                    packageinfo = packageinfo + " as a code snippet"
-                elif firstType == 'FILE_DEPENDENCY_DIRECT':
-                    packageinfo = packageinfo + " as a directly declared dependency"
-                elif firstType == 'FILE_DEPENDENCY_TRANSITIVE':
-                    packageinfo = packageinfo + " as a transitive dependency"
-
-        packagesuppliername = ''
-
-        if bom_package_supplier is not None and len(bom_package_supplier) > 0:
-            packageinfo = packageinfo + ", the PackageSupplier was provided by the user at the BOM level"
-            packagesuppliername = packagesuppliername + bom_package_supplier
-            pkg = "supplier:{}/{}/{}".format(bom_package_supplier.replace("Organization: ", ""), tcomp['componentName'],
-                                             tcomp['componentVersionName'])
-        elif component_package_supplier is not None and len(component_package_supplier) > 0:
-            packageinfo = packageinfo + ", the PackageSupplier was populated in the component"
-            packagesuppliername = packagesuppliername + component_package_supplier
-            pkg = "supplier:{}/{}/{}".format(component_package_supplier.replace("Organization: ", ""),
-                                             tcomp['componentName'], tcomp['componentVersionName'])
-        elif bomentry['origins'] is not None and len(bomentry['origins']) > 0:
-            packagesuppliername = packagesuppliername + "Organization: " + bomentry['origins'][0]['externalNamespace']
-            packageinfo = packageinfo + ", the PackageSupplier was based on the externalNamespace"
+    # homepage = 'NOASSERTION'
+    homepage = comp_data['url']
+
+    bom_package_supplier = comp_data['supplier']
+
+    packageinfo = "This is a"
+
+    if bomentry['componentType'] == 'CUSTOM_COMPONENT':
+        packageinfo = packageinfo + " custom component"
+    if bomentry['componentType'] == 'SUB_PROJECT':
+        packageinfo = packageinfo + " sub project"
+    else:
+        packageinfo = packageinfo + "n open source component from the Black Duck Knowledge Base"
+
+    if len(bomentry['matchTypes']) > 0:
+        firstType = bomentry['matchTypes'][0]
+        if firstType == 'MANUAL_BOM_COMPONENT':
+            packageinfo = packageinfo + " which was manually added"
         else:
-            packageinfo = packageinfo + ", the PackageSupplier was not populated"
-            packagesuppliername = packagesuppliername + "NOASSERTION"
-
-        # TO DO - use packagesuppliername somewhere
-
-        thisdict = {
-            "SPDXID": spdx.quote(spdxpackage_name),
-            "name": spdx.quote(tcomp['componentName']),
-            "versionInfo": spdx.quote(tcomp['componentVersionName']),
-            "packageFileName": spdx.quote(package_file),
-            "description": spdx.quote(desc),
-            "downloadLocation": spdx.quote(download_url),
-            "packageHomepage": spdx.quote(homepage),
-            # PackageChecksum: SHA1: 85ed0817af83a24ad8da68c2b5094de69833983c,
-            "licenseConcluded": spdx.quote(lic_string),
-            "licenseDeclared": spdx.quote(lic_string),
-            "licenseComments": "The concluded license was taken from the package level",
-            "packageSupplier": packagesuppliername,
-            # PackageLicenseComments: <text>Other versions available for a commercial license</text>,
-            "filesAnalyzed": False,
-            "packageComment": spdx.quote(packageinfo),
-            # "ExternalRef: SECURITY cpe23Type {}".format(cpe),
-            # "ExternalRef: PACKAGE-MANAGER purl pkg:" + pkg,
-            # ExternalRef: PERSISTENT-ID swh swh:1:cnt:94a9ed024d3859793618152ea559a168bbcbb5e2,
-            # ExternalRef: OTHER LocationRef-acmeforge acmecorp/acmenator/4.1.3-alpha,
-            # ExternalRefComment: This is the external ref for Acme,
-            "copyrightText": spdx.quote(copyrights),
-            "annotations": annotations,
-        }
+            packageinfo = packageinfo + " which was automatically detected"
+            if firstType == 'FILE_EXACT':
+                packageinfo = packageinfo + " as a direct file match"
+            elif firstType == 'SNIPPET':
+                packageinfo = packageinfo + " as a code snippet"
+            elif firstType == 'FILE_DEPENDENCY_DIRECT':
+                packageinfo = packageinfo + " as a directly declared dependency"
+            elif firstType == 'FILE_DEPENDENCY_TRANSITIVE':
+                packageinfo = packageinfo + " as a transitive dependency"
+
+    packagesuppliername = ''
+
+    if bom_package_supplier is not None and len(bom_package_supplier) > 0:
+        packageinfo = packageinfo + ", the PackageSupplier was provided by the user at the BOM level"
+        packagesuppliername = packagesuppliername + bom_package_supplier
+        pkg = "supplier:{}/{}/{}".format(bom_package_supplier.replace("Organization: ", ""), bomentry['componentName'],
+                                         bomentry['componentVersionName'])
+    elif component_package_supplier is not None and len(component_package_supplier) > 0:
+        packageinfo = packageinfo + ", the PackageSupplier was populated in the component"
+        packagesuppliername = packagesuppliername + component_package_supplier
+        pkg = "supplier:{}/{}/{}".format(component_package_supplier.replace("Organization: ", ""),
+                                         bomentry['componentName'], bomentry['componentVersionName'])
+    elif bomentry['origins'] is not None and len(bomentry['origins']) > 0:
+        packagesuppliername = packagesuppliername + "Organization: " + bomentry['origins'][0]['externalNamespace']
+        packageinfo = packageinfo + ", the PackageSupplier was based on the externalNamespace"
+    else:
+        packageinfo = packageinfo + ", the PackageSupplier was not populated"
+        packagesuppliername = packagesuppliername + "NOASSERTION"
+
+    # TO DO - use packagesuppliername somewhere
+
+    thisdict = {
+        "SPDXID": spdx.quote_name(spdxpackage_name),
+        "name": spdx.quote_name(bomentry['componentName']),
+        "versionInfo": spdx.quote_name(bomentry['componentVersionName']),
+        "packageFileName": spdx.quote(package_file),
+        "description": spdx.quote(desc),
+        "downloadLocation": spdx.quote(download_url),
+        "packageHomepage": spdx.quote(homepage),
+        # PackageChecksum: SHA1: 85ed0817af83a24ad8da68c2b5094de69833983c,
+        "licenseConcluded": spdx.quote_name(lic_string),
+        "licenseDeclared": spdx.quote_name(lic_string),
+        "licenseComments": "The concluded license was taken from the package level",
+        "packageSupplier": packagesuppliername,
+        # PackageLicenseComments: <text>Other versions available for a commercial license</text>,
+        "filesAnalyzed": False,
+        "packageComment": spdx.quote(packageinfo),
+        # "ExternalRef: SECURITY cpe23Type {}".format(cpe),
+        # "ExternalRef: PACKAGE-MANAGER purl pkg:" + pkg,
+        # ExternalRef: PERSISTENT-ID swh swh:1:cnt:94a9ed024d3859793618152ea559a168bbcbb5e2,
+        # ExternalRef: OTHER LocationRef-acmeforge acmecorp/acmenator/4.1.3-alpha,
+        # ExternalRefComment: This is the external ref for Acme,
+        "copyrightText": spdx.quote(copyrights),
+        "annotations": annotations,
+    }
+
+    if pkg != '':
+        thisdict["externalRefs"] = [
+            {
+                "referenceLocator": pkg,
+                "referenceCategory": "PACKAGE_MANAGER",
+                "referenceType": "purl"
+            },
+            {
+                "referenceCategory": "OTHER",
+                "referenceType": "BlackDuckHub-Component",
+                "referenceLocator": bomentry['component'],
+            },
+            {
+                "referenceCategory": "OTHER",
+                "referenceType": "BlackDuckHub-Component-Version",
+                "referenceLocator": cver
+            }
+        ]
+        if openhub_url is not None:
+            thisdict['externalRefs'].append({
+                "referenceCategory": "OTHER",
+                "referenceType": "OpenHub",
+                "referenceLocator": openhub_url
+            })
+
+    if incremental.digests_enabled():
+        # The component version is also needed to find the package again when it has no package URL
+        refs = thisdict.setdefault("externalRefs", [
+            {
+                "referenceCategory": "OTHER",
+                "referenceType": "BlackDuckHub-Component-Version",
+                "referenceLocator": cver
+            }
+        ])
+        refs.append(incremental.digest_ref(bomentry))
+
+    return sbom.Package(**thisdict), extracted
 
-        if pkg != '':
-            thisdict["externalRefs"] = [
-                {
-                    "referenceLocator": pkg,
-                    "referenceCategory": "PACKAGE_MANAGER",
-                    "referenceType": "purl"
-                },
-                {
-                    "referenceCategory": "OTHER",
-                    "referenceType": "BlackDuckHub-Component",
-                    "referenceLocator": tcomp['component'],
-                },
-                {
-                    "referenceCategory": "OTHER",
-                    "referenceType": "BlackDuckHub-Component-Version",
-                    "referenceLocator": cver
-                }
-            ]
-            if openhub_url is not None:
-                thisdict['externalRefs'].append({
-                    "referenceCategory": "OTHER",
-                    "referenceType": "OpenHub",
-                    "referenceLocator": openhub_url
-                })
-
-        globals.spdx['packages'].append(thisdict)
-    return spdxpackage_name
 
+def add_extracted_licenses(extracted):
+    for mydict in extracted:
+        globals.sbom.add_license(mydict)
 
-def process_children(pkgname, compverurl, child_url, indenttext, comps_dict, comp_data_dict):
+
+def render_or_copy(comp, comp_data):
+    cver = comp['componentVersion']
+    if fragments.enabled():
+        # Reuse the serialized package if it was rendered from the same data before
+        cached = fragments.get(comp, comp_data)
+        if cached is not None:
+            package, extracted = cached
+            globals.sbom.set_package(cver, package)
+            add_extracted_licenses(extracted)
+            return
+    package, extracted = render_comp(comp, comp_data)
+    add_extracted_licenses(extracted)
+    if fragments.enabled():
+        package = fragments.put(comp, comp_data, package, extracted)
+    globals.sbom.set_package(cver, package)
+
+
+async def process_children(pkgname, compverurl, child_url, indenttext, comps_dict, pipe, children):
     # res = globals.bd.get_json(child_url + '?limit=5000')
-    items = data.get_data_paged(globals.bd, child_url, {})
+    # A subtree which has already been walked (the same dependency under another parent) is replayed from the
+    # relationships it produced the first time
+    key = (compverurl, child_url)
+    if key in globals.hier_subtrees:
+        relationships, count = globals.hier_subtrees[key]
+        globals.sbom.graph.add_triples(relationships)
+        globals.subtree_replays += 1
+        return count
+    first_reln = globals.sbom.graph.count()
+
+    items = children[child_url]
 
     count = 0
     for child in items:
@@ -183,62 +242,122 @@ def process_children(pkgname, compverurl, child_url, indenttext, comps_dict, com
             print("{}{}/{} (SKIPPED)".format(indenttext, child['componentName'], '?'))
             continue
 
-        childpkgname = process_comp(comps_dict, child, comp_data_dict)
+        childpkgname = await process_comp(comps_dict, child, pipe)
         count += 1
         if childpkgname != '':
-            reln = False
-            for tchecktype in globals.matchtype_depends_dict.keys():
-                if tchecktype in child['matchTypes']:
-                    spdx.add_relationship(pkgname, childpkgname, globals.matchtype_depends_dict[tchecktype])
-                    reln = True
-                    break
-            if not reln:
-                for tchecktype in globals.matchtype_contains_dict.keys():
-                    if tchecktype in child['matchTypes']:
-                        spdx.add_relationship(pkgname, childpkgname,
-                                              globals.matchtype_contains_dict[tchecktype])
-                        break
-            globals.processed_comp_list.append(child['componentVersion'])
+            process_comp_relationship(pkgname, childpkgname, child['matchTypes'])
+            globals.sbom.mark_processed(child['componentVersion'])
         else:
             pass
 
-        if len(child['_meta']['links']) > 2:
-            thisref = [d['href'] for d in child['_meta']['links'] if d['rel'] == 'children']
-            if len(thisref) > 0:
-                count += process_children(childpkgname, child['componentVersion'], thisref[0], "    " + indenttext,
-                                          comps_dict, comp_data_dict)
+        thisref = get_children_href(child)
+        if thisref is not None:
+            count += await process_children(childpkgname, child['componentVersion'], thisref,
+                                            "    " + indenttext, comps_dict, pipe, children)
 
+    globals.hier_subtrees[key] = (globals.sbom.graph.triples_from(first_reln), count)
     return count
 
 
+def get_children_href(hcomp, top=False):
+    if top or len(hcomp['_meta']['links']) > 2:
+        thisref = [d['href'] for d in hcomp['_meta']['links'] if d['rel'] == 'children']
+        if len(thisref) > 0:
+            return thisref[0]
+    return None
+
+
+async def get_hierarchy(version, sub_project=False):
+    # Fetches the hierarchical BOM breadth first - the children links of all components at one level are
+    # fetched concurrently before moving to the next level
+    if snapshot.offline():
+        return snapshot.get_hierarchy(version)
+    hcomps = await data.get_hierarchical_bom(version, fallback=sub_project)
+    children = {}
+    level = [(hcomp, True) for hcomp in hcomps]
+    while len(level) > 0:
+        hrefs = []
+        for hcomp, top in level:
+            if 'componentVersionName' not in hcomp:
+                continue
+            href = get_children_href(hcomp, top)
+            if href is not None and href not in children and href not in hrefs:
+                hrefs.append(href)
+        results = await asyncio.gather(*[data.get_data_paged(globals.bd, href, {}) for href in hrefs])
+        level = []
+        for href, items in zip(hrefs, results):
+            children[href] = items
+            level += [(item, False) for item in items]
+    snapshot.add_hierarchy(version, hcomps, children)
+    return hcomps, children
+
+
+def get_relationship_type(mtypes):
+    # Dependency match types take priority, then the first containing match type in matchtype_contains_dict
+    # order - the result only depends on which match types are present so is looked up by their frozenset
+    key = frozenset(mtypes)
+    if key not in globals.matchtype_relationships:
+        reln = next((globals.matchtype_depends_dict[mtype] for mtype in globals.matchtype_depends_dict
+                     if mtype in key), None)
+        if reln is None:
+            reln = next((globals.matchtype_contains_dict[mtype] for mtype in globals.matchtype_contains_dict
+                         if mtype in key), None)
+        globals.matchtype_relationships[key] = reln
+    return globals.matchtype_relationships[key]
+
+
 def process_comp_relationship(parentname, childname, mtypes):
-    reln = False
-    for tchecktype in globals.matchtype_depends_dict.keys():
-        if tchecktype in mtypes:
-            spdx.add_relationship(parentname, childname, globals.matchtype_depends_dict[tchecktype])
-            reln = True
-            break
-    if not reln:
-        for tchecktype in globals.matchtype_contains_dict.keys():
-            if tchecktype in mtypes:
-                spdx.add_relationship(parentname, childname, globals.matchtype_contains_dict[tchecktype])
-                break
-
-
-def process_project(project, version, projspdxname, hcomps, bearer_token, exclude_ignored=False):
-    # project, version = check_projver(proj, ver)
+    reln = get_relationship_type(mtypes)
+    if reln is not None:
+        spdx.add_relationship(parentname, childname, reln)
 
-    start_time = time.time()
-    print('Getting component list ... ', end='')
-    bom_compsdict = data.get_bom_components(version, exclude_ignored)
-    print("({})".format(str(len(bom_compsdict))))
-    if config.args.debug:
-        print("--- %s seconds ---" % (time.time() - start_time))
+
+async def process_project(project, version, projspdxname, exclude_ignored=False, sub_project=False):
+    # project, version = check_projver(proj, ver)
 
     start_time = time.time()
-    if platform.system() == "Windows":
-        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-    comp_data_dict = asyncio.run(async_main(bom_compsdict, bearer_token, version))
+    print('Getting component list ...')
+    # Components are streamed through data retrieval and rendering as each page of the component list arrives,
+    # while the hierarchical BOM is fetched alongside (or afterwards for an incremental export, as it may not be
+    # needed)
+    copy_possible = incremental.loaded() and not sub_project and not config.args.recursive
+    hier_task = None
+    if not copy_possible:
+        hier_task = asyncio.ensure_future(get_hierarchy(version, sub_project))
+    pipe = pipeline.Pipeline(async_get_export_comp_data, render_or_copy, config.args.blackduck_max_concurrency,
+                             2 * config.args.blackduck_max_concurrency)
+    pipe.start()
+    pages = {}
+    planned_urls = set()
+    planned_lic_refs = []
+    async for offset, comps in data.iter_bom_components(version, exclude_ignored):
+        pages[offset] = comps
+        new_comps = {}
+        for comp in comps:
+            if comp['componentVersion'] not in pipe.queued and not copy_unchanged(comp):
+                new_comps.setdefault(comp['componentVersion'], comp)
+        if not snapshot.offline() and len(new_comps) > 0:
+            # The requests for each page are reported before they are started
+            lic_refs = [lic_ref for lic_ref in get_license_refs(new_comps) if lic_ref not in planned_lic_refs]
+            planned_lic_refs += lic_refs
+            planner.report(planner.plan_requests(new_comps, lic_refs, planned_urls), len(new_comps))
+        for comp in new_comps.values():
+            await pipe.put(comp)
+    bom_compsdict = data.comps_by_version(pages)
+    print("Found {} components".format(str(len(bom_compsdict))))
+
+    if copy_possible and incremental.unchanged(bom_compsdict):
+        # Nothing has changed since the previous export - the hierarchy does not need to be processed again
+        print('No components changed - copying packages and relationships from previous SPDX file')
+        incremental.copy_document()
+        await pipe.finish()
+        globals.sbom.add_packages()
+        return len(bom_compsdict)
+
+    print('Getting component data ... ')
+    if hier_task is None:
+        hier_task = asyncio.ensure_future(get_hierarchy(version, sub_project))
+    hcomps, children = await hier_task
     if config.args.debug:
         print("--- %s seconds ---" % (time.time() - start_time))
 
@@ -256,19 +375,21 @@ def process_project(project, version, projspdxname, hcomps, bearer_token, exclud
             print("{}/? - (no version - skipping)".format(hcomp['componentName']))
             continue
 
-        pkgname = process_comp(bom_compsdict, hcomp, comp_data_dict)
+        pkgname = await process_comp(bom_compsdict, hcomp, pipe)
 
         if pkgname != '':
             process_comp_relationship(projspdxname, pkgname, hcomp['matchTypes'])
-            globals.processed_comp_list.append(hcomp['componentVersion'])
+            globals.sbom.mark_processed(hcomp['componentVersion'])
             compcount += 1
 
-            href = [d['href'] for d in hcomp['_meta']['links'] if d['rel'] == 'children']
-            if len(href) > 0:
-                compcount += process_children(pkgname, hcomp['componentVersion'], href[0], "--> ", bom_compsdict,
-                                              comp_data_dict)
+            href = get_children_href(hcomp, top=True)
+            if href is not None:
+                compcount += await process_children(pkgname, hcomp['componentVersion'], href, "--> ",
+                                                    bom_compsdict, pipe, children)
 
     print('Processed {} hierarchical components'.format(compcount))
+    if config.args.debug:
+        print("Replayed {} repeated subtrees".format(globals.subtree_replays))
     if config.args.debug:
         print("--- %s seconds ---" % (time.time() - start_time))
 
@@ -284,7 +405,7 @@ def process_project(project, version, projspdxname, hcomps, bearer_token, exclud
             continue
 
         compname = bom_component['componentName'] + "/" + bom_component['componentVersionName']
-        if bom_component['componentVersion'] in globals.processed_comp_list:
+        if globals.sbom.is_processed(bom_component['componentVersion']):
             continue
         # Check if this component is a sub-project
         # if bom_component['matchTypes'][0] == "MANUAL_BOM_COMPONENT":
@@ -292,322 +413,309 @@ def process_project(project, version, projspdxname, hcomps, bearer_token, exclud
             print(compname)
         compcount += 1
 
-        pkgname = process_comp(bom_compsdict, bom_component, comp_data_dict)
+        pkgname = await process_comp(bom_compsdict, bom_component, pipe)
 
         process_comp_relationship(projspdxname, pkgname, bom_component['matchTypes'])
 
         if config.args.recursive and bom_component['componentName'] in globals.proj_list:
             #
             # Need to check if this component is a sub-project
-            params = {
-                'q': "name:" + bom_component['componentName'],
-            }
-            sub_projects = globals.bd.get_resource('projects', params=params)
-            for sub_proj in sub_projects:
-                params = {
-                    'q': "versionName:" + bom_component['componentVersionName'],
-                }
-                sub_versions = globals.bd.get_resource('versions', parent=sub_proj, params=params)
-                for sub_ver in sub_versions:
-                    print("Processing project within project '{}'".format(
-                        bom_component['componentName'] + '/' + bom_component['componentVersionName']))
-
-                    res = globals.bd.list_resources(parent=sub_ver)
-                    # if 'components' in res:
-                    #     sub_comps = globals.bd.get_resource('components', parent=sub_ver)
-                    # else:
-                    #     thishref = res['href'] + "/components?limit=2000"
-                    #     headers = {
-                    #         'accept': "application/vnd.blackducksoftware.bill-of-materials-6+json",
-                    #     }
-                    #     res2 = globals.bd.get_json(thishref, headers=headers)
-                    #     sub_comps = res2['items']
-
-                    if 'hierarchical-components' in res:
-                        sub_hierarchical_bom = globals.bd.get_resource('hierarchical-components', parent=sub_ver)
-                    else:
-                        thishref = res['href'] + "/hierarchical-components?limit=2000"
-                        headers = {
-                            'accept': "application/vnd.blackducksoftware.bill-of-materials-6+json",
-                        }
-                        res2 = globals.bd.get_json(thishref, headers=headers)
-                        sub_hierarchical_bom = res2['items']
-
-                    subprojspdxname = spdx.clean_for_spdx(bom_component['componentName'] + '/' +
-                                                          bom_component['componentVersionName'])
-                    # subproj_compsdict = get_bom_components(sub_ver)
-                    # subproj_comp_data_dict = asyncio.run(async_main(subproj_compsdict, bearer_token, res['href']))
-                    subproj, subver = projects.check_projver(bom_component['componentName'],
-                                                             bom_component['componentVersionName'])
-                    compcount += process_project(subproj, subver,
-                                                 subprojspdxname, sub_hierarchical_bom, bearer_token)
-                    break
-                break
+            subprojver = await find_sub_project(bom_component['componentName'], bom_component['componentVersionName'])
+            if subprojver is not None:
+                print("Processing project within project '{}'".format(
+                    bom_component['componentName'] + '/' + bom_component['componentVersionName']))
+
+                subprojspdxname = spdx.clean_for_spdx(bom_component['componentName'] + '/' +
+                                                      bom_component['componentVersionName'])
+                # subproj_compsdict = get_bom_components(sub_ver)
+                # subproj_comp_data_dict = asyncio.run(async_main(subproj_compsdict, bearer_token, res['href']))
+                subproj, subver = subprojver
+                compcount += await process_project(subproj, subver, subprojspdxname, sub_project=True)
 
     print('Processed {} other components'.format(compcount))
     if config.args.debug:
         print("--- %s seconds ---" % (time.time() - start_time))
-    # print('Output {} Overall components'.format(len(globals.processed_comp_list)))
+
+    start_time = time.time()
+    await pipe.finish()
+    if incremental.loaded() and not sub_project:
+        print("Reused {} unchanged components from previous SPDX file".format(len(incremental.reused)))
+    if config.args.debug:
+        print("Rendered {} packages".format(pipe.rendered))
+        print("--- %s seconds ---" % (time.time() - start_time))
+    if not sub_project:
+        globals.sbom.add_packages()
+    # print('Output {} Overall components'.format(len(globals.sbom.processed)))
 
     return compcount
 
 
-async def async_main(compsdict, token, ver):
-    async with aiohttp.ClientSession() as session:
-        copyright_tasks = []
-        comment_tasks = []
-        file_tasks = []
-        lic_tasks = []
-        url_tasks = []
-        supplier_tasks = []
-        # child_tasks = []
-        for url, comp in compsdict.items():
-            if config.args.debug:
-                print(comp['componentName'] + '/' + comp['componentVersionName'])
-            copyright_task = asyncio.ensure_future(async_get_copyrights(session, comp, token))
-            copyright_tasks.append(copyright_task)
-
-            comment_task = asyncio.ensure_future(async_get_comments(session, comp, token))
-            comment_tasks.append(comment_task)
-
-            file_task = asyncio.ensure_future(async_get_files(session, comp, token))
-            file_tasks.append(file_task)
-
-            lic_task = asyncio.ensure_future(async_get_licenses(session, comp, token))
-            lic_tasks.append(lic_task)
-
-            url_task = asyncio.ensure_future(async_get_url(session, comp, token))
-            url_tasks.append(url_task)
-
-            supplier_task = asyncio.ensure_future(async_get_supplier(session, comp, token))
-            supplier_tasks.append(supplier_task)
-
-        print('Getting component data ... ')
-        all_copyrights = dict(await asyncio.gather(*copyright_tasks))
-        all_comments = dict(await asyncio.gather(*comment_tasks))
-        all_files = dict(await asyncio.gather(*file_tasks))
-        all_lics = dict(await asyncio.gather(*lic_tasks))
-        all_urls = dict(await asyncio.gather(*url_tasks))
-        all_suppliers = dict(await asyncio.gather(*supplier_tasks))
-
-        # all_children = dict(await asyncio.gather(*child_tasks))
-        await asyncio.sleep(0.250)
-
-    comp_data_dict = {}
-    for cvurl in compsdict.keys():
-        comp_data_dict[cvurl] = {
-            'copyrights': all_copyrights[cvurl],
-            'comments': all_comments[cvurl],
-            'files': all_files[cvurl],
-            'licenses': all_lics[cvurl],
-            'url': all_urls[cvurl],
-            'supplier': all_suppliers[cvurl]
+async def find_sub_project(name, vername):
+    # Returns the project and version for a BOM component which is a sub-project, otherwise None
+    if snapshot.offline():
+        return snapshot.get_sub_project(name, vername)
+    params = {
+        'q': "name:" + name,
+    }
+    sub_projects = await globals.bd.get_resource('projects', params=params)
+    for sub_proj in sub_projects:
+        params = {
+            'q': "versionName:" + vername,
         }
-    return comp_data_dict
-
+        sub_versions = await globals.bd.get_resource('versions', parent=sub_proj, params=params)
+        for sub_ver in sub_versions:
+            subproj, subver = await projects.check_projver(name, vername)
+            snapshot.add_sub_project(name, vername, subproj, subver)
+            return subproj, subver
+        break
+    return None
+
+
+async def async_get_export_comp_data(comp):
+    # Component data comes from the snapshot when rendering offline (--from_snapshot), otherwise from the server
+    if snapshot.offline():
+        return await snapshot.get_comp_data(comp)
+    comp_data = await async_get_comp_data(comp)
+    snapshot.add_comp_data(comp, comp_data)
+    return comp_data
+
+
+async def async_get_comp_data(comp):
+    # Fetch all of the data selected for one component concurrently
+    tasks = {}
+    if planner.wants('copyrights'):
+        tasks['copyrights'] = async_get_copyrights(comp)
+    if planner.wants('comments'):
+        tasks['comments'] = async_get_comments(comp)
+    if planner.wants('files'):
+        tasks['files'] = async_get_files(comp)
+    if planner.wants('homepage'):
+        tasks['url'] = async_get_url(comp)
+    if planner.wants('supplier'):
+        tasks['supplier'] = async_get_supplier(comp)
+    openhub_url = planner.get_link(comp['_meta']['links'], 'openhub')
+    if config.args.download_loc and openhub_url is not None:
+        tasks['download'] = globals.openhub.get_download(openhub_url['href'])
+    tasks['lic_texts'] = async_get_license_texts(get_comp_license_refs(comp))
+    results = await asyncio.gather(*tasks.values())
+
+    # Fields which were not requested get the same values as components without that data
+    comp_data = {
+        'copyrights': "NOASSERTION",
+        'comments': [],
+        'files': "NOASSERTION",
+        'url': "NOASSERTION",
+        'supplier': '',
+        'download': "NOASSERTION"
+    }
+    comp_data.update(zip(tasks.keys(), results))
+    return comp_data
 
-async def async_get_copyrights(session, comp, token):
-    if not globals.verify:
-        ssl = False
-    else:
-        ssl = None
 
-    copyrights = "NOASSERTION"
+async def async_get_copyrights(comp):
     if len(comp['origins']) < 1:
-        return comp['componentVersion'], copyrights
-
+        return "NOASSERTION"
+    # The origin is chosen in each BOM, so the copyrights are cached by the origin rather than the component version
     orig = comp['origins'][0]
     link = next((item for item in orig['_meta']['links'] if item["rel"] == "component-origin-copyrights"), None)
-    thishref = link['href'] + "?limit=100"
+    if not link:
+        return "NOASSERTION"
+    return await cache.cached('copyrights', link['href'], lambda: async_fetch_copyrights(link['href']))
+
+
+async def async_fetch_copyrights(link):
+    copyrights = "NOASSERTION"
+    thishref = link + "?limit=100"
     headers = {
         'accept': "application/vnd.blackducksoftware.copyright-4+json",
-        'Authorization': f'Bearer {token}',
     }
     # resp = globals.bd.get_json(thishref, headers=headers)
-    async with session.get(thishref, headers=headers, ssl=ssl) as resp:
-        result_data = await resp.json()
-        for copyrt in result_data['items']:
-            if copyrt['active']:
-                thiscr = copyrt['updatedCopyright'].splitlines()[0].strip()
-                if thiscr not in copyrights:
-                    if copyrights == "NOASSERTION":
-                        copyrights = thiscr
-                    else:
-                        copyrights += "\n" + thiscr
-    return comp['componentVersion'], copyrights
-
-
-async def async_get_comments(session, comp, token):
-    if not globals.verify:
-        ssl = False
-    else:
-        ssl = None
+    result_data = await globals.bd.get_json(thishref, headers=headers, epclass='copyrights')
+    for copyrt in result_data['items']:
+        if copyrt['active']:
+            thiscr = copyrt['updatedCopyright'].splitlines()[0].strip()
+            if thiscr not in copyrights:
+                if copyrights == "NOASSERTION":
+                    copyrights = thiscr
+                else:
+                    copyrights += "\n" + thiscr
+    return copyrights
 
+
+async def async_get_comments(comp):
     annotations = []
     hrefs = comp['_meta']['links']
 
     link = next((item for item in hrefs if item["rel"] == "comments"), None)
     if link:
-        thishref = link['href']
-        headers = {
-            'Authorization': f'Bearer {token}',
-            'accept': "application/vnd.blackducksoftware.bill-of-materials-6+json",
-        }
-        # resp = globals.bd.get_json(thishref, headers=headers)
-        async with session.get(thishref, headers=headers, ssl=ssl) as resp:
-            result_data = await resp.json()
-            mytime = datetime.datetime.now()
-            # mytime.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-            for comment in result_data['items']:
-                annotations.append(
-                    {
-                        "annotationDate": spdx.quote(mytime.strftime("%Y-%m-%dT%H:%M:%S.%fZ")),
-                        "annotationType": "OTHER",
-                        "annotator": spdx.quote("Person: " + comment['user']['email']),
-                        "comment": spdx.quote(comment['comment']),
-                    }
-                )
-    return comp['componentVersion'], annotations
-
-
-async def async_get_files(session, comp, token):
-    if not globals.verify:
-        ssl = False
-    else:
-        ssl = None
+        # Only the comment authors and text are cached - the annotation date is the time of this export
+        comments = await cache.cached('comments', link['href'], lambda: async_fetch_comments(link['href']))
+        mytime = datetime.datetime.now()
+        # mytime.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        for email, comment in comments:
+            annotations.append(
+                {
+                    "annotationDate": spdx.quote(mytime.strftime("%Y-%m-%dT%H:%M:%S.%fZ")),
+                    "annotationType": "OTHER",
+                    "annotator": spdx.quote_name("Person: " + email),
+                    "comment": spdx.quote(comment),
+                }
+            )
+    return annotations
 
-    retfile = "NOASSERTION"
+
+async def async_fetch_comments(thishref):
+    headers = {
+        'accept': "application/vnd.blackducksoftware.bill-of-materials-6+json",
+    }
+    # resp = globals.bd.get_json(thishref, headers=headers)
+    result_data = await globals.bd.get_json(thishref, headers=headers, epclass='comments')
+    return [[comment['user']['email'], comment['comment']] for comment in result_data['items']]
+
+
+async def async_get_files(comp):
     hrefs = comp['_meta']['links']
 
     link = next((item for item in hrefs if item["rel"] == "matched-files"), None)
-    if link:
-        thishref = link['href']
-        headers = {
-            'Authorization': f'Bearer {token}',
-            'accept': "application/vnd.blackducksoftware.bill-of-materials-6+json",
-        }
+    if not link:
+        return "NOASSERTION"
+    return await cache.cached('files', link['href'], lambda: async_fetch_files(link['href']))
 
-        async with session.get(thishref, headers=headers, ssl=ssl) as resp:
-            result_data = await resp.json()
-            cfile = result_data['items']
-            if len(cfile) > 0:
-                rfile = cfile[0]['filePath']['path']
-                for ext in ['.jar', '.ear', '.war', '.zip', '.gz', '.tar', '.xz', '.lz', '.bz2', '.7z',
-                            '.rar', '.rar', '.cpio', '.Z', '.lz4', '.lha', '.arj', '.rpm', '.deb', '.dmg',
-                            '.gz', '.whl']:
-                    if rfile.endswith(ext):
-                        retfile = rfile
-    return comp['componentVersion'], retfile
-
-
-async def async_get_licenses(session, lcomp, token):
-    if not globals.verify:
-        ssl = False
-    else:
-        ssl = None
 
-    # Get licenses
-    lic_string = "NOASSERTION"
-    quotes = False
+async def async_fetch_files(thishref):
+    retfile = "NOASSERTION"
+    headers = {
+        'accept': "application/vnd.blackducksoftware.bill-of-materials-6+json",
+    }
+
+    result_data = await globals.bd.get_json(thishref, headers=headers, epclass='matched-files')
+    cfile = result_data['items']
+    if len(cfile) > 0:
+        rfile = cfile[0]['filePath']['path']
+        for ext in ['.jar', '.ear', '.war', '.zip', '.gz', '.tar', '.xz', '.lz', '.bz2', '.7z',
+                    '.rar', '.rar', '.cpio', '.Z', '.lz4', '.lha', '.arj', '.rpm', '.deb', '.dmg',
+                    '.gz', '.whl']:
+            if rfile.endswith(ext):
+                retfile = rfile
+    return retfile
+
+
+def get_comp_licenses(lcomp):
+    proc_item = lcomp['licenses']
     license_type = "NONE"
-    if 'licenses' in lcomp.keys():
-        proc_item = lcomp['licenses']
+    if len(proc_item[0]['licenses']) > 1:
+        license_type = proc_item[0]['licenseType']
+        proc_item = proc_item[0]['licenses']
+    return license_type, proc_item
 
-        if len(proc_item[0]['licenses']) > 1:
-            license_type = proc_item[0]['licenseType']
-            proc_item = proc_item[0]['licenses']
 
+def get_comp_license_refs(comp):
+    lic_refs = []
+    if 'licenses' in comp.keys():
+        license_type, proc_item = get_comp_licenses(comp)
         for lic in proc_item:
-            thislic = ''
-            if 'spdxId' in lic:
-                thislic = lic['spdxId']
-                if thislic in spdx.spdx_deprecated_dict.keys():
-                    thislic = spdx.spdx_deprecated_dict[thislic]
-            else:
-                # Custom license
-                try:
-                    thislic = 'LicenseRef-' + spdx.clean_for_spdx(lic['licenseDisplay'] + '-' + lcomp['componentName'])
-                    lic_ref = lic['license'].split("/")[-1]
-                    headers = {
-                        'accept': "text/plain",
-                        'Authorization': f'Bearer {token}',
-                    }
-                    # resp = globals.bd.session.get('/api/licenses/' + lic_ref + '/text', headers=headers)
-                    thishref = f"{globals.bd.base_url}/api/licenses/{lic_ref}/text"
-                    async with session.get(thishref, headers=headers, ssl=ssl) as resp:
-                        # lic_text = await resp.content.decode("utf-8")
-                        lic_text = await resp.text('utf-8')
-                        if thislic not in globals.spdx_lics:
-                            mydict = {
-                                'licenseID': spdx.quote(thislic),
-                                'extractedText': spdx.quote(lic_text)
-                            }
-                            globals.spdx["hasExtractedLicensingInfos"].append(mydict)
-                            globals.spdx_lics.append(thislic)
-                except Exception as exc:
-                    pass
-            if lic_string == "NOASSERTION":
-                lic_string = thislic
-            else:
-                if license_type == "DISJUNCTIVE":
-                    lic_string = lic_string + " OR " + thislic
-                else:
-                    lic_string = lic_string + " AND " + thislic
-                quotes = True
+            if 'spdxId' not in lic and 'license' in lic:
+                lic_ref = lic['license'].split("/")[-1]
+                if lic_ref not in lic_refs:
+                    lic_refs.append(lic_ref)
+    return lic_refs
 
-        if quotes:
-            lic_string = "(" + lic_string + ")"
 
-    return lcomp['componentVersion'], lic_string
+def get_license_refs(compsdict):
+    lic_refs = []
+    for comp in compsdict.values():
+        for lic_ref in get_comp_license_refs(comp):
+            if lic_ref not in lic_refs:
+                lic_refs.append(lic_ref)
+    return lic_refs
 
 
-async def async_get_url(session, comp, token):
-    if not globals.verify:
-        ssl = False
-    else:
-        ssl = None
+async def async_get_license_texts(lic_refs):
+    # Custom (non-SPDX) license texts are shared between components - each one is only fetched once per run
+    lic_texts = await asyncio.gather(*[async_get_license_text(lic_ref) for lic_ref in lic_refs])
+    return dict(zip(lic_refs, lic_texts))
 
-    url = "NOASSERTION"
+
+async def async_get_license_text(lic_ref):
+    task = globals.lic_texts.get(lic_ref)
+    if task is None:
+        task = asyncio.ensure_future(async_fetch_license_text(lic_ref))
+        globals.lic_texts[lic_ref] = task
+    return await asyncio.shield(task)
+
+
+async def async_fetch_license_text(lic_ref):
+    headers = {
+        'accept': "text/plain",
+    }
+    # resp = globals.bd.session.get('/api/licenses/' + lic_ref + '/text', headers=headers)
+    thishref = f"{globals.bd.base_url}/api/licenses/{lic_ref}/text"
+    try:
+        return await cache.cached('licenses', thishref,
+                                  lambda: globals.bd.get_text(thishref, headers=headers, epclass='licenses'))
+    except Exception as exc:
+        print("WARNING: Unable to get text for license {}\n".format(lic_ref) + str(exc))
+        return None
+
+
+def get_licenses(lcomp, lic_texts, extracted):
+    # Get licenses - the custom license texts needed are appended to extracted
+    if 'licenses' not in lcomp.keys():
+        return "NOASSERTION"
+    license_type, proc_item = get_comp_licenses(lcomp)
+    lic_string, refs = licenses.compile_expression(
+        licenses.license_key(license_type, proc_item, lcomp.get('componentName')))
+    for licref, lic_ref in refs:
+        lic_text = lic_texts.get(lic_ref)
+        if lic_text is not None:
+            mydict = {
+                'licenseID': spdx.quote_name(licref),
+                'extractedText': spdx.quote(lic_text)
+            }
+            extracted.append(mydict)
+
+    return lic_string
+
+
+async def async_get_url(comp):
     if 'component' not in comp.keys():
-        return comp['componentVersion'], url
+        return "NOASSERTION"
+    return await cache.cached('homepage', comp['component'], lambda: async_fetch_url(comp['component']))
 
-    link = comp['component']
+
+async def async_fetch_url(link):
+    url = "NOASSERTION"
     headers = {
         'accept': "application/vnd.blackducksoftware.bill-of-materials-6+json",
-        'Authorization': f'Bearer {token}',
     }
     # resp = globals.bd.get_json(thishref, headers=headers)
-    async with session.get(link, headers=headers, ssl=ssl) as resp:
-        result_data = await resp.json()
-        if 'url' in result_data.keys():
-            url = result_data['url']
-    return comp['componentVersion'], url
+    result_data = await globals.bd.get_json(link, headers=headers, epclass='component')
+    if 'url' in result_data.keys():
+        url = result_data['url']
+    return url
 
 
-async def async_get_supplier(session, comp, token):
-    if not globals.verify:
-        ssl = False
-    else:
-        ssl = None
-
-    supplier_name = ''
+async def async_get_supplier(comp):
     hrefs = comp['_meta']['links']
 
     link = next((item for item in hrefs if item["rel"] == "custom-fields"), None)
-    if link:
-        thishref = link['href']
-        headers = {
-            'Authorization': f'Bearer {token}',
-            'accept': "application/vnd.blackducksoftware.bill-of-materials-6+json",
-        }
+    if not link:
+        return ''
+    return await cache.cached('supplier', link['href'], lambda: async_fetch_supplier(link['href']))
+
+
+async def async_fetch_supplier(thishref):
+    supplier_name = ''
+    headers = {
+        'accept': "application/vnd.blackducksoftware.bill-of-materials-6+json",
+    }
 
-        async with session.get(thishref, headers=headers, ssl=ssl) as resp:
-            result_data = await resp.json()
-            cfields = result_data['items']
-            sbom_field = next((item for item in cfields if item['label'] == globals.SBOM_CUSTOM_SUPPLIER_NAME),
-                              None)
+    result_data = await globals.bd.get_json(thishref, headers=headers, epclass='custom-fields')
+    cfields = result_data['items']
+    sbom_field = next((item for item in cfields if item['label'] == globals.SBOM_CUSTOM_SUPPLIER_NAME),
+                      None)
 
-            if sbom_field is not None and len(sbom_field['values']) > 0:
-                supplier_name = sbom_field['values'][0]
+    if sbom_field is not None and len(sbom_field['values']) > 0:
+        supplier_name = sbom_field['values'][0]
 
-    return comp['componentVersion'], supplier_name
+    return supplier_name
@@ -4,8 +4,8 @@ import sys
 from export_spdx import globals, data
 
 
-def get_all_projects():
-    projs = globals.bd.get_resource('projects', items=True)
+async def get_all_projects():
+    projs = await globals.bd.get_resource('projects', items=True)
 
     projlist = []
     for proj in projs:
@@ -13,16 +13,16 @@ def get_all_projects():
     return projlist
 
 
-def check_projver(proj, ver):
+async def check_projver(proj, ver):
     params = {
         'q': "name:" + proj,
         'sort': 'name',
     }
 
-    projects = globals.bd.get_resource('projects', params=params)
+    projects = await globals.bd.get_resource('projects', params=params)
     for p in projects:
         if p['name'] == proj:
-            versions = globals.bd.get_resource('versions', parent=p, params=params)
+            versions = await globals.bd.get_resource('versions', parent=p, params=params)
             for v in versions:
                 if v['versionName'] == ver:
                     return p, v
@@ -33,13 +33,13 @@ def check_projver(proj, ver):
 
     print("Project '{}' does not exist".format(proj))
     print('Available projects:')
-    projects = globals.bd.get_resource('projects')
+    projects = await globals.bd.get_resource('projects')
     for proj in projects:
         print(proj['name'])
     sys.exit(2)
 
 
-def get_bom_components(verdict):
+async def get_bom_components(verdict):
     comp_dict = {}
     res = globals.bd.list_resources(verdict)
     # if 'components' not in res:
@@ -53,7 +53,7 @@ def get_bom_components(verdict):
         }
         # res = globals.bd.get_json(thishref, headers=headers)
         # bom_comps = res['items']
-        bom_comps = data.get_data_paged(globals.bd, thishref, headers)
+        bom_comps = await data.get_data_paged(globals.bd, thishref, headers)
     # else:
     #     bom_comps = globals.bd.get_resource('components', parent=ver)
     for comp in bom_comps:
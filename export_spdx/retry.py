@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+import asyncio
+import datetime
+import email.utils
+import random
+
+import aiohttp
+
+from export_spdx import cassette
+
+# HTTP status codes considered transient (Too Many Requests, Internal Server Error, Bad Gateway,
+# Service Unavailable, Gateway Timeout)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Longest wait honoured from a Retry-After header (seconds)
+MAX_RETRY_AFTER = 300
+
+
+class RetryPolicy:
+    def __init__(self, max_retries=5, run_budget=1000, base_delay=1.0, max_delay=60.0):
+        self.max_retries = max_retries
+        self.run_budget = run_budget
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.wait_time = 0.0
+        self.by_reason = {}
+
+    def allow(self, attempt):
+        return attempt < self.max_retries and self.retries < self.run_budget
+
+    def backoff(self, attempt, reason, retry_after=None):
+        # Full jitter exponential backoff unless the server told us how long to wait
+        delay = parse_retry_after(retry_after)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        self.retries += 1
+        self.wait_time += delay
+        self.by_reason[reason] = self.by_reason.get(reason, 0) + 1
+        return delay
+
+    def report(self, debug=False):
+        if self.retries == 0:
+            return
+        print("Retried {} requests ({:.1f} seconds spent waiting)".format(self.retries, self.wait_time))
+        if debug:
+            print("Retries by reason: " + ', '.join("{}={}".format(k, v) for k, v in sorted(self.by_reason.items())))
+
+
+policy = RetryPolicy()
+
+
+def configure(max_retries, run_budget):
+    global policy
+    policy = RetryPolicy(max_retries=max_retries, run_budget=run_budget)
+
+
+def parse_retry_after(value):
+    if value is None:
+        return None
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            when = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if when is None:
+            return None
+        delay = (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+    return min(max(delay, 0.0), MAX_RETRY_AFTER)
+
+
+async def read_json(resp):
+    return await resp.json()
+
+
+async def read_text(resp):
+    return await resp.text('utf-8')
+
+
+async def async_request(session, method, url, headers, ssl, params=None, reader=read_json):
+    attempt = 0
+    while True:
+        try:
+            async with cassette.exchange(session, method, url, headers, ssl, params=params) as resp:
+                if resp.status in RETRY_STATUSES and policy.allow(attempt):
+                    delay = policy.backoff(attempt, str(resp.status), resp.headers.get('Retry-After'))
+                else:
+                    resp.raise_for_status()
+                    return await reader(resp)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as exc:
+            if not policy.allow(attempt):
+                raise
+            delay = policy.backoff(attempt, type(exc).__name__)
+        await asyncio.sleep(delay)
+        attempt += 1
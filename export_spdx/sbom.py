@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+import array
+import enum
+import json
+
+# Relationship JSON as json.dump(indent=4, sort_keys=True) writes it
+RELATIONSHIP_JSON = '{{\n    "relatedSpdxElement": {},\n    "relationshipType": {},\n    "spdxElementId": {}\n}}'
+
+
+class RelationshipType(enum.IntEnum):
+    # SPDX 2.2 relationship types
+    DESCRIBES = 0
+    DESCRIBED_BY = 1
+    CONTAINS = 2
+    CONTAINED_BY = 3
+    DEPENDS_ON = 4
+    DEPENDENCY_OF = 5
+    DEPENDENCY_MANIFEST_OF = 6
+    BUILD_DEPENDENCY_OF = 7
+    DEV_DEPENDENCY_OF = 8
+    OPTIONAL_DEPENDENCY_OF = 9
+    PROVIDED_DEPENDENCY_OF = 10
+    TEST_DEPENDENCY_OF = 11
+    RUNTIME_DEPENDENCY_OF = 12
+    EXAMPLE_OF = 13
+    GENERATES = 14
+    GENERATED_FROM = 15
+    ANCESTOR_OF = 16
+    DESCENDANT_OF = 17
+    VARIANT_OF = 18
+    DISTRIBUTION_ARTIFACT = 19
+    PATCH_FOR = 20
+    PATCH_APPLIED = 21
+    COPY_OF = 22
+    FILE_ADDED = 23
+    FILE_DELETED = 24
+    FILE_MODIFIED = 25
+    EXPANDED_FROM_ARCHIVE = 26
+    DYNAMIC_LINK = 27
+    STATIC_LINK = 28
+    DATA_FILE_OF = 29
+    TEST_CASE_OF = 30
+    BUILD_TOOL_OF = 31
+    DEV_TOOL_OF = 32
+    TEST_OF = 33
+    TEST_TOOL_OF = 34
+    DOCUMENTATION_OF = 35
+    OPTIONAL_COMPONENT_OF = 36
+    METAFILE_OF = 37
+    PACKAGE_OF = 38
+    AMENDS = 39
+    PREREQUISITE_FOR = 40
+    HAS_PREREQUISITE = 41
+    OTHER = 42
+
+
+class Package:
+    # Compact record for a rendered SPDX package - fields which have not been set are not output
+    __slots__ = ('SPDXID', 'name', 'versionInfo', 'packageFileName', 'description', 'downloadLocation',
+                 'packageHomepage', 'licenseConcluded', 'licenseDeclared', 'licenseComments', 'packageSupplier',
+                 'filesAnalyzed', 'packageComment', 'copyrightText', 'annotations', 'externalRefs')
+
+    def __init__(self, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__ if hasattr(self, name)}
+
+
+class RelationshipGraph:
+    # Relationships between SPDX elements, stored once each as triples of integers (parent, type, child) into a
+    # table of SPDX IDs and only turned into JSON when the output is written. The adjacency index for queries is
+    # built when first needed
+    def __init__(self):
+        self.id_names = []
+        self.id_index = {}
+        self.triples = array.array('I')
+        self.keys = set()
+        self.duplicates = 0
+        self.adjacency = None
+
+    def intern(self, spdxid):
+        index = self.id_index.get(spdxid)
+        if index is None:
+            index = len(self.id_names)
+            self.id_names.append(spdxid)
+            self.id_index[spdxid] = index
+        return index
+
+    def add(self, parent, reln, child):
+        self.add_triple(self.intern(parent), RelationshipType[reln], self.intern(child))
+
+    def add_triple(self, parent, reln, child):
+        # Returns False for a duplicate of an existing relationship, which is not stored
+        key = (parent << 38) | (child << 6) | reln
+        if key in self.keys:
+            self.duplicates += 1
+            return False
+        self.keys.add(key)
+        self.triples.extend((parent, reln, child))
+        self.adjacency = None
+        return True
+
+    def add_triples(self, triples):
+        for i in range(0, len(triples), 3):
+            self.add_triple(triples[i], triples[i + 1], triples[i + 2])
+
+    def count(self):
+        return len(self.triples) // 3
+
+    def triples_from(self, index):
+        return self.triples[3 * index:]
+
+    def build_adjacency(self):
+        children = {}
+        parents = {}
+        for i in range(0, len(self.triples), 3):
+            parent, reln, child = self.triples[i], self.triples[i + 1], self.triples[i + 2]
+            children.setdefault(parent, []).append((reln, child))
+            parents.setdefault(child, []).append((reln, parent))
+        self.adjacency = (children, parents)
+
+    def neighbours(self, spdxid, direction):
+        if spdxid not in self.id_index:
+            return []
+        if self.adjacency is None:
+            self.build_adjacency()
+        return [(RelationshipType(reln).name, self.id_names[other])
+                for reln, other in self.adjacency[direction].get(self.id_index[spdxid], [])]
+
+    def children(self, spdxid):
+        # (relationship type, child SPDX ID) for each relationship from this element
+        return self.neighbours(spdxid, 0)
+
+    def parents(self, spdxid):
+        # (relationship type, parent SPDX ID) for each relationship to this element
+        return self.neighbours(spdxid, 1)
+
+    def __iter__(self):
+        for i in range(0, len(self.triples), 3):
+            yield (self.id_names[self.triples[i]], RelationshipType(self.triples[i + 1]).name,
+                   self.id_names[self.triples[i + 2]])
+
+    def iter_json(self):
+        names = [json.dumps(name) for name in self.id_names]
+        types = [json.dumps(reln.name) for reln in RelationshipType]
+        for i in range(0, len(self.triples), 3):
+            yield RELATIONSHIP_JSON.format(names[self.triples[i + 2]], types[self.triples[i + 1]],
+                                           names[self.triples[i]])
+
+
+class SBOM:
+    # The SPDX document being built, with indexes for the lookups made while processing the BOM - package names
+    # claimed (SPDXID to component version), component versions processed in the hierarchy, extracted licenses by
+    # LicenseRef and the relationship graph
+    def __init__(self):
+        self.doc = {
+            'snippets': [],
+            'hasExtractedLicensingInfos': [],
+        }
+        self.packages = []
+        self.ids = {}
+        self.processed = set()
+        self.licenses = set()
+        self.pending = {}
+        self.graph = RelationshipGraph()
+
+    def claim(self, spdxid, cver):
+        # Returns False if the package name has already been claimed
+        if spdxid in self.ids:
+            return False
+        self.ids[spdxid] = cver
+        return True
+
+    def mark_processed(self, cver):
+        self.processed.add(cver)
+
+    def is_processed(self, cver):
+        return cver in self.processed
+
+    def add_license(self, lic):
+        if lic['licenseID'] not in self.licenses:
+            self.doc['hasExtractedLicensingInfos'].append(lic)
+            self.licenses.add(lic['licenseID'])
+
+    def set_package(self, cver, package):
+        # Rendered package, added to the document by add_packages
+        self.pending[cver] = package
+
+    def add_package(self, package):
+        self.packages.append(package)
+
+    def add_packages(self):
+        # Packages are output in the order their names were first claimed while processing the BOM
+        for spdxid, cver in self.ids.items():
+            if cver in self.pending:
+                self.packages.append(self.pending.pop(cver))
+
+    def report(self):
+        print("Relationship graph: {} relationships between {} elements ({} duplicates not stored)".format(
+            self.graph.count(), len(self.graph.id_names), self.graph.duplicates))
+        unrelated = [spdxid for spdxid in self.ids if len(self.graph.parents(spdxid)) == 0]
+        if len(unrelated) > 0:
+            print("{} packages have no relationship from another element".format(len(unrelated)))
+
+    def lists(self):
+        # Document lists held in compact form, for spdx.write_spdx_file
+        return {
+            'packages': self.packages,
+            'relationships': self.graph.iter_json(),
+        }
+
+    def document(self):
+        # The whole document as dicts (for --modify_spdx_fields)
+        doc = dict(self.doc)
+        doc['packages'] = [package.to_dict() if isinstance(package, Package) else package
+                           for package in self.packages]
+        doc['relationships'] = [{
+            "spdxElementId": parent,
+            "relationshipType": reln,
+            "relatedSpdxElement": child
+        } for parent, reln, child in self.graph]
+        return doc
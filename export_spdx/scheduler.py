@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+import sys
+import time
+import asyncio
+import aiohttp
+
+from export_spdx import globals
+from export_spdx import config
+
+
+class Scheduler:
+    # Limits the number of Black Duck requests in flight, both overall and per endpoint class, so large BOMs
+    # do not open thousands of simultaneous connections to the server
+    def __init__(self, max_inflight, class_limits, max_connections, max_rate=None):
+        self.max_connections = max_connections
+        self.interval = None
+        if max_rate:
+            self.interval = 1.0 / max_rate
+        self.rate_lock = asyncio.Lock()
+        self.next_start = 0.0
+        self.global_sem = asyncio.Semaphore(max_inflight)
+        self.class_sems = {}
+        for epclass, limit in class_limits.items():
+            self.class_sems[epclass] = asyncio.Semaphore(limit)
+        self.inflight = 0
+        self.peak_inflight = 0
+        self.counts = {}
+
+    def connector(self):
+        return aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.max_connections)
+
+    async def run(self, epclass, coro):
+        # Class slot is taken first so that callers queued on a busy class do not hold global slots
+        if epclass is None:
+            return await self.run_global('other', coro)
+        async with self.class_sems[epclass]:
+            return await self.run_global(epclass, coro)
+
+    async def run_global(self, epclass, coro):
+        async with self.global_sem:
+            if self.interval is not None:
+                await self.wait_rate()
+            self.inflight += 1
+            self.peak_inflight = max(self.peak_inflight, self.inflight)
+            self.counts[epclass] = self.counts.get(epclass, 0) + 1
+            try:
+                return await coro
+            finally:
+                self.inflight -= 1
+
+    async def wait_rate(self):
+        # Space out the start of requests when a maximum request rate is set
+        async with self.rate_lock:
+            now = time.monotonic()
+            if self.next_start > now:
+                await asyncio.sleep(self.next_start - now)
+            self.next_start = max(now, self.next_start) + self.interval
+
+    def report(self):
+        print("Requests by endpoint class: {} (peak in flight {})".format(
+            ', '.join("{}={}".format(k, v) for k, v in sorted(self.counts.items())), self.peak_inflight))
+
+
+def create_scheduler():
+    return Scheduler(config.args.blackduck_max_concurrency, config.args.blackduck_endpoint_concurrency,
+                     config.args.blackduck_max_connections, config.args.blackduck_max_rate)
+
+
+def parse_class_limits(limit_str, default_limit):
+    class_limits = {}
+    for epclass in globals.endpoint_classes:
+        class_limits[epclass] = default_limit
+
+    if limit_str is None or limit_str == '':
+        return class_limits
+
+    for entry in limit_str.split(','):
+        entry = entry.strip()
+        if entry == '':
+            continue
+        try:
+            epclass, limit = entry.split('=')
+            epclass = epclass.strip()
+            limit = int(limit)
+        except ValueError:
+            print("ERROR: Invalid endpoint concurrency entry '{}' (expected <class>=<number>)".format(entry))
+            sys.exit(2)
+        if epclass not in class_limits:
+            print("ERROR: Unknown endpoint class '{}' (valid classes are {})".format(
+                epclass, ', '.join(globals.endpoint_classes)))
+            sys.exit(2)
+        if limit < 1:
+            print("ERROR: Endpoint concurrency for '{}' must be at least 1".format(epclass))
+            sys.exit(2)
+        class_limits[epclass] = limit
+    return class_limits
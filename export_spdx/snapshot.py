@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+import gzip
+import json
+import sys
+
+from export_spdx import globals
+
+# Snapshot of everything fetched from the server during an export (--save_snapshot), from which the SPDX output
+# can be rendered again without any network access (--from_snapshot)
+SNAPSHOT_FORMAT = 1
+
+recording = None
+loaded = None
+missing_data = 0
+
+
+def start_recording():
+    global recording
+    recording = {
+        'format': SNAPSHOT_FORMAT,
+        'script_version': globals.script_version,
+        'project': None,
+        'version': None,
+        'proj_list': [],
+        'versions': {},
+        'sub_projects': [],
+        'comp_data': {},
+    }
+
+
+def offline():
+    return loaded is not None
+
+
+def version_entry(verdict):
+    return recording['versions'].setdefault(verdict['_meta']['href'], {'pages': {}, 'hierarchy': [], 'children': {}})
+
+
+def add_project(project, version, proj_list):
+    if recording is not None:
+        recording['project'] = project
+        recording['version'] = version
+        recording['proj_list'] = proj_list
+
+
+def add_bom_page(verdict, offset, bom_comps):
+    # The unfiltered page is kept so that the snapshot can be rendered with or without ignored components
+    if recording is not None:
+        version_entry(verdict)['pages'][str(offset)] = bom_comps
+
+
+def add_hierarchy(verdict, hcomps, children):
+    if recording is not None:
+        entry = version_entry(verdict)
+        entry['hierarchy'] = hcomps
+        entry['children'] = children
+
+
+def add_comp_data(comp, comp_data):
+    if recording is not None and comp_data is not None:
+        recording['comp_data'][comp['componentVersion']] = comp_data
+
+
+def add_sub_project(name, vername, subproj, subver):
+    if recording is not None:
+        recording['sub_projects'].append([name, vername, subproj, subver])
+
+
+def save(filename):
+    try:
+        with gzip.open(filename, "wt", encoding="utf-8") as f:
+            json.dump(recording, f, separators=(',', ':'))
+    except OSError as exc:
+        print("ERROR: Unable to write snapshot file '{}'\n".format(filename) + str(exc))
+        sys.exit(2)
+    print("Saved snapshot of {} components to '{}'".format(len(recording['comp_data']), filename))
+
+
+def load(filename):
+    global loaded
+    try:
+        with gzip.open(filename, "rt", encoding="utf-8") as f:
+            loaded = json.load(f)
+    except (OSError, ValueError) as exc:
+        print("ERROR: Unable to read snapshot file '{}'\n".format(filename) + str(exc))
+        sys.exit(2)
+    if loaded.get('format') != SNAPSHOT_FORMAT:
+        print("ERROR: Snapshot file '{}' was written by an incompatible version of this script".format(filename))
+        sys.exit(2)
+    print("Loaded snapshot of {} components from '{}'".format(len(loaded['comp_data']), filename))
+
+
+def get_project(proj, ver):
+    project, version = loaded['project'], loaded['version']
+    if project['name'] != proj or version['versionName'] != ver:
+        print("ERROR: Snapshot is for project '{}' version '{}'".format(project['name'], version['versionName']))
+        sys.exit(2)
+    return project, version
+
+
+def get_proj_list():
+    return loaded['proj_list']
+
+
+def get_bom_pages(verdict):
+    pages = loaded['versions'].get(verdict['_meta']['href'], {}).get('pages', {})
+    return [(int(offset), pages[offset]) for offset in sorted(pages.keys(), key=int)]
+
+
+def get_hierarchy(verdict):
+    entry = loaded['versions'].get(verdict['_meta']['href'], {})
+    return entry.get('hierarchy', []), entry.get('children', {})
+
+
+async def get_comp_data(comp):
+    global missing_data
+    comp_data = loaded['comp_data'].get(comp['componentVersion'])
+    if comp_data is None:
+        # Not fetched when the snapshot was saved (for example an ignored component excluded with -x)
+        missing_data += 1
+        comp_data = {
+            'copyrights': "NOASSERTION",
+            'comments': [],
+            'files': "NOASSERTION",
+            'url': "NOASSERTION",
+            'supplier': '',
+            'download': "NOASSERTION",
+            'lic_texts': {},
+        }
+    return comp_data
+
+
+def get_sub_project(name, vername):
+    for entry in loaded['sub_projects']:
+        if entry[0] == name and entry[1] == vername:
+            return entry[2], entry[3]
+    return None
+
+
+def report():
+    if missing_data > 0:
+        print("WARNING: {} components had no data in the snapshot and were output without it".format(missing_data))
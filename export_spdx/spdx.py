@@ -1,7 +1,8 @@
 #!/usr/bin/env python
-import re
+import functools
 import json
 import sys
+import uuid
 
 from export_spdx import globals
 from export_spdx import config
@@ -77,29 +78,30 @@ spdx_origin_map = {
 }
 
 
+# Characters removed from or replaced in SPDX identifiers, and removed from quoted values
+clean_table = str.maketrans({';': None, ':': None, '!': None, '*': None, '(': None, ')': None, '/': None, ',': None,
+                             ' ': None, '.': None, '@': '-at-', '_': 'uu'})
+quote_table = str.maketrans({'"': None, "'": None})
+
+
+# Identifiers and names are used several times per component with mostly repeated values so results are memoized.
+# Free text (descriptions, copyrights, comments and license texts) is mostly unique so is quoted without the memo
+@functools.lru_cache(maxsize=65536)
 def clean_for_spdx(name):
-    newname = re.sub('[;:!*()/,]', '', name)
-    newname = re.sub('[ .]', '', newname)
-    newname = re.sub('@', '-at-', newname)
-    newname = re.sub('_', 'uu', newname)
+    return name.translate(clean_table)
+
 
-    return newname
+@functools.lru_cache(maxsize=65536)
+def quote_name(name):
+    return name.translate(quote_table)
 
 
 def quote(name):
-    remove_chars = ['"', "'"]
-    for i in remove_chars:
-        name = name.replace(i, '')
-    return name
+    return name.translate(quote_table)
 
 
 def add_relationship(parent, child, reln):
-    mydict = {
-        "spdxElementId": quote(parent),
-        "relationshipType": quote(reln),
-        "relatedSpdxElement": quote(child)
-    }
-    globals.spdx['relationships'].append(mydict)
+    globals.sbom.graph.add(quote_name(parent), quote_name(reln), quote_name(child))
 
 
 def add_snippet():
@@ -138,15 +140,50 @@ def add_snippet():
     pass
 
 
-def write_spdx_file(spdx):
+class RenderedPackage(str):
+    # Package already serialized as JSON (see render_package) which is written to the output as it is
+    pass
+
+
+def render_package(package):
+    if not isinstance(package, dict):
+        package = package.to_dict()
+    return RenderedPackage(json.dumps(package, indent=4, sort_keys=True))
+
+
+def write_spdx_file(spdx, lists=None):
+    # lists holds document lists (packages and relationships) which are written item by item rather than being
+    # built as dicts - items which are strings are already serialized
     print("Writing SPDX output file {} ... ".format(config.args.output), end='')
 
     try:
         with open(config.args.output, 'w') as outfile:
-            json.dump(spdx, outfile, indent=4, sort_keys=True)
+            if lists:
+                write_with_lists(spdx, lists, outfile)
+            else:
+                json.dump(spdx, outfile, indent=4, sort_keys=True)
 
     except Exception as e:
         print('ERROR: Unable to create output report file \n' + str(e))
         sys.exit(3)
 
     print("Done")
+
+
+def write_with_lists(spdx, lists, outfile):
+    # Serialize the document with a placeholder for each list, then write the items in its place indented to the
+    # level json.dump would use
+    placeholders = {name: uuid.uuid4().hex for name in lists}
+    text = json.dumps(dict(spdx, **{name: [placeholder] for name, placeholder in placeholders.items()}),
+                      indent=4, sort_keys=True)
+    for name, placeholder in sorted(placeholders.items(), key=lambda item: text.index(item[1])):
+        head, text = text.split('[\n        "{}"\n    ]'.format(placeholder))
+        outfile.write(head + "[")
+        empty = True
+        for item in lists[name]:
+            if not isinstance(item, str):
+                item = render_package(item)
+            outfile.write(("\n        " if empty else ",\n        ") + item.replace("\n", "\n        "))
+            empty = False
+        outfile.write("]" if empty else "\n    ]")
+    outfile.write(text)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+import argparse
+import asyncio
+import os
+import platform
+import re
+import sys
+
+from export_spdx import globals
+from export_spdx import config
+from export_spdx import main
+from export_spdx import process
+from export_spdx import data
+from export_spdx import pipeline
+from export_spdx import retry
+
+parser = argparse.ArgumentParser(description='"Fill the component data cache for Black Duck project versions so that '
+                                             'later SPDX exports are served from the cache"',
+                                 prog='bd_export_spdx_warm_cache', parents=[config.common_parser])
+parser.add_argument("--projects", type=str,
+                    help="Regular expression matching the names of projects to process (default all projects)",
+                    default="")
+parser.add_argument("--versions", type=str,
+                    help="Regular expression matching the names of versions to process (default all versions)",
+                    default="")
+parser.add_argument("--nice", type=int,
+                    help="Increase in process niceness so that the warm-up runs at low priority (default 10)",
+                    default=10)
+
+
+def run():
+    print("BLACK DUCK SPDX EXPORT CACHE WARM-UP VERSION {}\n".format(globals.script_version))
+
+    config.parse_args(parser)
+    config.check_common_params()
+    if config.args.no_cache and not config.args.shared_cache:
+        print("ERROR: No cache to fill (--no_cache is set and --shared_cache is not)")
+        sys.exit(2)
+    if config.args.blackduck_max_rate is None:
+        # Keep the load on the server low by default
+        config.args.blackduck_max_rate = 5.0
+    try:
+        projects_re = re.compile(config.args.projects)
+        versions_re = re.compile(config.args.versions)
+    except re.error as exc:
+        print("ERROR: Invalid --projects or --versions expression - " + str(exc))
+        sys.exit(2)
+
+    if config.args.nice > 0 and hasattr(os, 'nice'):
+        os.nice(config.args.nice)
+    retry.configure(config.args.blackduck_retries, config.args.blackduck_retry_budget)
+
+    if platform.system() == "Windows":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(main.async_run(lambda: warm_projects(projects_re, versions_re)))
+
+    if config.args.debug:
+        globals.bd.report()
+    retry.policy.report(config.args.debug)
+
+
+async def warm_projects(projects_re, versions_re):
+    total = 0
+    for project in await globals.bd.get_resource('projects'):
+        if not projects_re.search(project['name']):
+            continue
+        for version in await globals.bd.get_resource('versions', parent=project):
+            if not versions_re.search(version['versionName']):
+                continue
+            try:
+                total += await warm_version(project, version)
+            except Exception as exc:
+                print("WARNING: Unable to fill cache for project '{}' version '{}'\n".format(
+                    project['name'], version['versionName']) + str(exc))
+    print("Filled cache for {} components".format(total))
+
+
+async def warm_version(project, version):
+    # Fetching the data for every component stores it in the caches - the data itself is not needed here. Components
+    # are fed through the same bounded pipeline as an export as each page of the component list arrives
+    globals.lic_texts = {}
+    pipe = pipeline.Pipeline(process.async_get_comp_data, lambda comp, comp_data: None,
+                             config.args.blackduck_max_concurrency, 2 * config.args.blackduck_max_concurrency)
+    pipe.start()
+    try:
+        async for offset, comps in data.iter_bom_components(version):
+            for comp in comps:
+                await pipe.put(comp)
+    finally:
+        await pipe.finish()
+    print("Project '{}' version '{}': {} components".format(project['name'], version['versionName'],
+                                                           len(pipe.queued)))
+    return len(pipe.queued)
@@ -16,8 +16,7 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     url="https://github.com/matthewb66/bd_export_spdx2.2",
     packages=setuptools.find_packages(),
-    install_requires=['blackduck>=1.0.0',
-                      'lxml',
+    install_requires=['lxml',
                       'aiohttp'],
     classifiers=[
         "Programming Language :: Python :: 3",
@@ -26,6 +25,8 @@ setuptools.setup(
     ],
     python_requires='>=3.0',
     entry_points={
-        'console_scripts': ['bd_export_spdx=export_spdx.main:run'],
+        'console_scripts': ['bd_export_spdx=export_spdx.main:run',
+                            'bd_export_spdx_prune_cache=export_spdx.cache:prune',
+                            'bd_export_spdx_warm_cache=export_spdx.warm:run'],
     },
 )
@@ -0,0 +1,218 @@
+import asyncio
+import contextlib
+import datetime
+import json
+
+import aiohttp
+import pytest
+
+from export_spdx import bdclient
+from export_spdx import cache
+from export_spdx import cassette
+
+BASE_URL = "https://bd.example"
+
+
+class FakeSession:
+    # Answers each request with handler(url, headers, params) -> (status, headers, body) and keeps the requests made
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+
+    @contextlib.asynccontextmanager
+    async def request(self, method, url, headers=None, ssl=None, params=None):
+        self.requests.append((url, dict(headers), params))
+        status, resp_headers, body = await self.handler(url, headers, params)
+        yield cassette.ReplayResponse(method, url, {'status': status, 'headers': resp_headers, 'body': body})
+
+
+class FakeScheduler:
+    async def run(self, epclass, coro):
+        return await coro
+
+
+def make_client(handler):
+    client = bdclient.BDClient(BASE_URL, "api-token")
+    client.session = FakeSession(handler)
+    client.sched = FakeScheduler()
+    client.bearer_token = "bearer"
+    client.valid_until = datetime.datetime.now() + datetime.timedelta(days=1)
+    return client
+
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch):
+    monkeypatch.setattr(cache, 'store', None)
+    monkeypatch.setattr(cassette, 'recording', None)
+    monkeypatch.setattr(cassette, 'replaying', None)
+
+
+def test_concurrent_identical_gets_share_one_request():
+    release = asyncio.Event()
+
+    async def handler(url, headers, params):
+        await release.wait()
+        return 200, [], '{"url": "%s"}' % url
+
+    client = make_client(handler)
+
+    async def gets():
+        tasks = [asyncio.ensure_future(client.get_json(BASE_URL + "/api/components/1", epclass='copyrights'))
+                 for i in range(5)]
+        # A different Accept header or different parameters are a different request
+        tasks.append(asyncio.ensure_future(client.get_text(BASE_URL + "/api/components/1", epclass='copyrights')))
+        tasks.append(asyncio.ensure_future(client.get_json(BASE_URL + "/api/components/1", params={'limit': 10},
+                                                           epclass='copyrights')))
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(*tasks)
+
+    results = asyncio.run(gets())
+    assert results[:5] == [{'url': BASE_URL + "/api/components/1"}] * 5
+    assert len(client.session.requests) == 3
+    assert client.flight_hits == 4
+    assert client.flight_misses == 3
+    assert client.inflight == {}
+    # Results of classes which are not shared are not kept once the request completes
+    assert len(client.results) == 0
+    asyncio.run(client.get_json(BASE_URL + "/api/components/1", epclass='copyrights'))
+    assert len(client.session.requests) == 4
+
+
+def test_shared_results_kept_in_bounded_lru(monkeypatch):
+    monkeypatch.setattr(bdclient, 'SHARED_RESULTS_SIZE', 2)
+
+    async def handler(url, headers, params):
+        return 200, [], '{}'
+
+    client = make_client(handler)
+
+    async def get(n):
+        await client.get_json(BASE_URL + "/api/components/{}".format(n), epclass='component')
+
+    async def gets():
+        for n in [1, 2, 1, 3, 1, 2]:
+            await get(n)
+
+    asyncio.run(gets())
+    # 1 is used again before 3 is added, so 2 is the least recently used result and is dropped
+    assert [url for url, headers, params in client.session.requests] == [
+        BASE_URL + "/api/components/1", BASE_URL + "/api/components/2", BASE_URL + "/api/components/3",
+        BASE_URL + "/api/components/2"]
+    assert len(client.results) == 2
+    assert client.flight_hits == 2
+
+
+def test_failed_requests_are_not_kept():
+    responses = [(404, [], "not found"), (200, [], '{"ok": true}')]
+
+    async def handler(url, headers, params):
+        await asyncio.sleep(0)
+        return responses.pop(0)
+
+    client = make_client(handler)
+
+    async def gets():
+        return await asyncio.gather(*[client.get_json(BASE_URL + "/api/components/1", epclass='component')
+                                      for i in range(3)], return_exceptions=True)
+
+    results = asyncio.run(gets())
+    assert all(isinstance(result, aiohttp.ClientResponseError) and result.status == 404 for result in results)
+    assert len(client.session.requests) == 1
+    assert client.inflight == {}
+    assert len(client.results) == 0
+    # The next request is made again rather than getting the failure
+    assert asyncio.run(client.get_json(BASE_URL + "/api/components/1", epclass='component')) == {'ok': True}
+    assert len(client.session.requests) == 2
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = cache.DataCache(str(tmp_path), 1024 * 1024)
+    monkeypatch.setattr(cache, 'store', store)
+    yield store
+    store.close()
+
+
+def test_conditional_request_reuses_stored_body(store):
+    responses = [(200, [('ETag', '"v1"'), ('Last-Modified', "Mon, 01 Jun 2020 10:00:00 GMT")], '{"v": 1}'),
+                 (304, [('ETag', '"v1"')], ''),
+                 (200, [('ETag', '"v2"')], '{"v": 2}'),
+                 (304, [], '')]
+
+    async def handler(url, headers, params):
+        return responses.pop(0)
+
+    client = make_client(handler)
+    url = BASE_URL + "/api/components/1/versions/2/comments"
+
+    async def get():
+        return await client.get_json(url, epclass='comments')
+
+    assert asyncio.run(get()) == {'v': 1}
+    first_headers = client.session.requests[0][1]
+    assert 'if-none-match' not in first_headers and 'if-modified-since' not in first_headers
+
+    # Not modified - the stored body is returned
+    assert asyncio.run(get()) == {'v': 1}
+    headers = client.session.requests[1][1]
+    assert headers['if-none-match'] == '"v1"'
+    assert headers['if-modified-since'] == "Mon, 01 Jun 2020 10:00:00 GMT"
+
+    # Modified - the new body and validator replace the stored ones
+    assert asyncio.run(get()) == {'v': 2}
+    assert asyncio.run(get()) == {'v': 2}
+    headers = client.session.requests[3][1]
+    assert headers['if-none-match'] == '"v2"'
+    assert 'if-modified-since' not in headers
+    assert client.revalidation == {'comments': {'hit': 0, 'miss': 2, '304': 2}}
+    assert client.bytes_saved == len('{"v": 1}') + len('{"v": 2}')
+
+
+def test_max_age_reused_until_refresh(store):
+    responses = [(200, [('ETag', '"v1"'), ('Cache-Control', "max-age=3600")], 'text 1'),
+                 (304, [('Cache-Control', "max-age=3600")], '')]
+
+    async def handler(url, headers, params):
+        return responses.pop(0)
+
+    client = make_client(handler)
+    url = BASE_URL + "/api/licenses/1/text"
+
+    async def get():
+        return await client.get_text(url, epclass='licenses')
+
+    assert asyncio.run(get()) == 'text 1'
+    # Fresh - no request is made
+    assert asyncio.run(get()) == 'text 1'
+    assert len(client.session.requests) == 1
+    assert client.revalidation['licenses'] == {'hit': 1, 'miss': 1, '304': 0}
+
+    # --refresh revalidates fresh responses
+    store.refresh = True
+    assert asyncio.run(get()) == 'text 1'
+    assert len(client.session.requests) == 2
+    assert client.session.requests[1][1]['if-none-match'] == '"v1"'
+    assert client.revalidation['licenses'] == {'hit': 1, 'miss': 1, '304': 1}
+
+
+def test_responses_without_validators_not_stored(store):
+    responses = [(200, [], '{"v": 1}'), (200, [('ETag', '"v2"'), ('Cache-Control', "no-store")], '{"v": 2}'),
+                 (200, [], '{"v": 3}')]
+
+    async def handler(url, headers, params):
+        return responses.pop(0)
+
+    client = make_client(handler)
+    url = BASE_URL + "/api/components/1/versions/2/custom-fields"
+    for expected in [1, 2, 3]:
+        assert asyncio.run(client.get_json(url, epclass='custom-fields')) == {'v': expected}
+    assert all('if-none-match' not in headers for url, headers, params in client.session.requests)
+    assert store.get_response(json.dumps([url, [], "application/json"])) is None
+
+
+def test_max_age_parsing():
+    assert bdclient.get_max_age(None) == 0
+    assert bdclient.get_max_age("private, max-age=60") == 60
+    assert bdclient.get_max_age("no-cache, max-age=60") == 0
+    assert bdclient.get_max_age("public") == 0
@@ -0,0 +1,170 @@
+import os
+import sqlite3
+import sys
+import time
+
+import pytest
+
+from export_spdx import cache
+
+
+def test_reads_do_not_wait_for_another_writer(tmp_path):
+    store = cache.DataCache(str(tmp_path), 1024 * 1024)
+    store.put('copyrights', "https://bd.example/c1", "Copyright A")
+    other = sqlite3.connect(str(tmp_path / cache.CACHE_FILE), isolation_level=None)
+    other.execute('BEGIN IMMEDIATE')
+    assert store.get('copyrights', "https://bd.example/c1") == (True, "Copyright A")
+    assert store.get_response("key") is None
+    other.execute('ROLLBACK')
+    other.close()
+    assert not store.disabled
+    store.close()
+
+
+def test_lock_timeout_disables_cache(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(cache, 'LOCK_TIMEOUT', 0.1)
+    store = cache.DataCache(str(tmp_path), 1024 * 1024)
+    store.put('copyrights', "https://bd.example/c1", "Copyright A")
+    other = sqlite3.connect(str(tmp_path / cache.CACHE_FILE), isolation_level=None)
+    other.execute('BEGIN IMMEDIATE')
+    # A write which cannot get the lock is treated as a cache miss rather than failing the export
+    store.put('copyrights', "https://bd.example/c2", "Copyright B")
+    store.revalidated("key")
+    assert store.disabled
+    assert capsys.readouterr().out.startswith("WARNING: Component data cache error")
+    assert store.get('copyrights', "https://bd.example/c1") == (False, None)
+    assert store.get_response("key") is None
+    store.close()
+    other.execute('ROLLBACK')
+    other.close()
+
+    store = cache.DataCache(str(tmp_path), 1024 * 1024)
+    assert store.get('copyrights', "https://bd.example/c1") == (True, "Copyright A")
+    assert store.get('copyrights', "https://bd.example/c2") == (False, None)
+    store.close()
+
+
+class FakeTime:
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+def test_entries_expire_per_kind(tmp_path, monkeypatch):
+    clock = FakeTime(1000000.0)
+    monkeypatch.setattr(cache, 'time', clock)
+    store = cache.DataCache(str(tmp_path), 1024 * 1024)
+    for kind in ['comments', 'copyrights', 'licenses']:
+        store.put(kind, "https://bd.example/c1", kind)
+    clock.now += 2 * 86400
+    # Comments are kept for a day, copyrights for a week and license texts for 30 days
+    assert store.get('comments', "https://bd.example/c1") == (False, None)
+    assert store.get('copyrights', "https://bd.example/c1") == (True, 'copyrights')
+    clock.now += 7 * 86400
+    assert store.get('copyrights', "https://bd.example/c1") == (False, None)
+    assert store.get('licenses', "https://bd.example/c1") == (True, 'licenses')
+    # Data copied from the shared cache keeps the time it was first stored
+    store.put('comments', "https://bd.example/c2", "shared", stored=clock.now - 86400 - 1)
+    assert store.get('comments', "https://bd.example/c2") == (False, None)
+    assert (store.hits, store.misses) == (2, 3)
+
+    # --refresh ignores stored entries
+    store.refresh = True
+    assert store.get('licenses', "https://bd.example/c1") == (False, None)
+    store.close()
+
+    # Expired entries are removed when the cache is closed
+    db = sqlite3.connect(str(tmp_path / cache.CACHE_FILE))
+    assert db.execute('SELECT kind FROM entries').fetchall() == [('licenses',)]
+    db.close()
+
+
+def test_least_recently_used_entries_evicted(tmp_path, monkeypatch):
+    clock = FakeTime(1000000.0)
+    monkeypatch.setattr(cache, 'time', clock)
+    value = "x" * 98
+    store = cache.DataCache(str(tmp_path), 1000)
+    for n in range(4):
+        clock.now += 1
+        store.put('copyrights', "https://bd.example/c{}".format(n), value)
+    clock.now += 1
+    store.put_response("response", None, None, value)
+    # c0 is read after the others were stored, so c1 and c2 are the least recently used
+    clock.now += 1
+    assert store.get('copyrights', "https://bd.example/c0") == (True, value)
+    store.max_size = 300
+    store.close()
+
+    store = cache.DataCache(str(tmp_path), 300)
+    assert store.get('copyrights', "https://bd.example/c1") == (False, None)
+    assert store.get('copyrights', "https://bd.example/c2") == (False, None)
+    assert store.get('copyrights', "https://bd.example/c3") == (True, value)
+    assert store.get_response("response")[2] == value
+    assert store.get('copyrights', "https://bd.example/c0") == (True, value)
+    store.close()
+
+
+def make_entry(shared, kind, url, age):
+    shared.put(kind, url, "x" * 100)
+    path = shared.entry_path(kind, url)
+    when = time.time() - age
+    os.utime(path, (when, when))
+    return path
+
+
+def test_prune_removes_expired_then_oldest(tmp_path):
+    shared = cache.SharedCache(str(tmp_path))
+    expired = make_entry(shared, 'comments', "https://bd.example/c1", 2 * 86400)
+    oldest = make_entry(shared, 'copyrights', "https://bd.example/c1", 300)
+    older = make_entry(shared, 'copyrights', "https://bd.example/c2", 200)
+    newest = make_entry(shared, 'copyrights', "https://bd.example/c3", 100)
+    # Temporary files left by interrupted writers are removed once they are old enough
+    stale_tmp = oldest + ".1.tmp"
+    fresh_tmp = older + ".2.tmp"
+    for path, age in [(stale_tmp, 2 * cache.SHARED_TMP_AGE), (fresh_tmp, 10)]:
+        with open(path, "w") as f:
+            f.write("partial")
+        os.utime(path, (time.time() - age, time.time() - age))
+    size = os.path.getsize(newest)
+
+    removed, total = cache.prune_shared(str(tmp_path), 2 * size)
+    assert removed == 3
+    assert total == 2 * size
+    assert [os.path.exists(path) for path in [expired, oldest, older, newest, stale_tmp, fresh_tmp]] == \
+        [False, False, True, True, False, True]
+    assert shared.get('copyrights', "https://bd.example/c3")['value'] == "x" * 100
+
+
+def test_prune_skips_files_removed_during_scan(tmp_path, monkeypatch):
+    shared = cache.SharedCache(str(tmp_path))
+    paths = [make_entry(shared, 'copyrights', "https://bd.example/c{}".format(n), 100 - n) for n in range(20)]
+    walk = os.walk
+
+    def racing_walk(top):
+        # Another runner removes every other entry after the directory has been listed
+        for root, dirs, files in walk(top):
+            for name in files[::2]:
+                os.remove(os.path.join(root, name))
+            yield root, dirs, files
+
+    monkeypatch.setattr(cache.os, 'walk', racing_walk)
+    removed, total = cache.prune_shared(str(tmp_path), 0)
+    assert total == 0
+    assert not any(os.path.exists(path) for path in paths)
+    assert not cache.remove_file(paths[0])
+
+
+def test_prune_command(tmp_path, monkeypatch, capsys):
+    shared = cache.SharedCache(str(tmp_path))
+    make_entry(shared, 'comments', "https://bd.example/c1", 2 * 86400)
+    make_entry(shared, 'copyrights', "https://bd.example/c1", 100)
+    monkeypatch.setattr(sys, 'argv', ['bd_export_spdx_prune_cache', str(tmp_path), '--max_size', '1'])
+    cache.prune()
+    assert capsys.readouterr().out.startswith("Removed 1 entries from shared cache")
+
+    monkeypatch.setattr(sys, 'argv', ['bd_export_spdx_prune_cache', str(tmp_path / "missing")])
+    with pytest.raises(SystemExit) as exc:
+        cache.prune()
+    assert exc.value.code == 2
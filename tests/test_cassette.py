@@ -0,0 +1,150 @@
+import asyncio
+import contextlib
+import gzip
+import json
+
+import aiohttp
+import pytest
+from multidict import CIMultiDict, CIMultiDictProxy
+
+from export_spdx import cassette
+
+BASE_URL = "https://bd.example"
+
+
+class FakeResponse:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = CIMultiDictProxy(CIMultiDict(headers))
+        self.body = body
+
+    async def read(self):
+        return self.body.encode('utf-8')
+
+
+class FakeSession:
+    # Serves the given responses for (method, url) in order and keeps the requests made
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    @contextlib.asynccontextmanager
+    async def request(self, method, url, headers=None, ssl=None, params=None):
+        self.requests.append((method, url, params))
+        yield self.responses[(method, url)].pop(0)
+
+
+@pytest.fixture(autouse=True)
+def reset_cassette(monkeypatch):
+    monkeypatch.setattr(cassette, 'recording', None)
+    monkeypatch.setattr(cassette, 'replaying', None)
+    monkeypatch.setattr(cassette, 'replayed', 0)
+
+
+async def run_exchanges(session, requests):
+    results = []
+    for method, url, headers, params in requests:
+        async with cassette.exchange(session, method, url, headers, None, params=params) as resp:
+            results.append((resp.status, dict(resp.headers), (await resp.read()).decode('utf-8')))
+    return results
+
+
+REQUESTS = [
+    ('POST', BASE_URL + "/api/tokens/authenticate", {'Authorization': "token secret"}, None),
+    ('GET', BASE_URL + "/api/projects", {'accept': "application/json"}, {'limit': '100', 'offset': '0'}),
+    ('GET', BASE_URL + "/api/projects", {'accept': "application/json"}, {'offset': '0', 'limit': '100'}),
+    ('GET', BASE_URL + "/api/licenses/1/text", {'accept': "text/plain"}, None),
+]
+
+
+def make_session():
+    return FakeSession({
+        ('POST', BASE_URL + "/api/tokens/authenticate"): [
+            FakeResponse(200, [('X-CSRF-TOKEN', "csrf-secret"), ('Set-Cookie', "session=1")],
+                         json.dumps({'bearerToken': "bearer-secret", 'expiresInMilliseconds': 7200000})),
+        ],
+        ('GET', BASE_URL + "/api/projects"): [
+            FakeResponse(200, [('Content-Type', "application/json")], '{"items": [1]}'),
+            FakeResponse(200, [('Content-Type', "application/json")], '{"items": [2]}'),
+        ],
+        ('GET', BASE_URL + "/api/licenses/1/text"): [
+            FakeResponse(404, [], "not found"),
+        ],
+    })
+
+
+def test_record_and_replay_round_trip(tmp_path):
+    filename = str(tmp_path / "cassette.json.gz")
+    cassette.start_recording()
+    session = make_session()
+    recorded = asyncio.run(run_exchanges(session, REQUESTS))
+    assert len(session.requests) == 4
+    # The live responses are not changed by recording
+    assert recorded[0][1]['X-CSRF-TOKEN'] == "csrf-secret"
+    assert json.loads(recorded[0][2])['bearerToken'] == "bearer-secret"
+    cassette.save(filename)
+
+    cassette.recording = None
+    cassette.load(filename)
+    replayed = asyncio.run(run_exchanges(None, REQUESTS))
+    assert cassette.replayed == 4
+
+    # Tokens are redacted and cookies dropped, everything else is as recorded
+    status, headers, body = replayed[0]
+    assert status == 200
+    assert headers == {'X-CSRF-TOKEN': "REDACTED"}
+    assert json.loads(body) == {'bearerToken': "REDACTED", 'expiresInMilliseconds': 7200000}
+    # Repeated requests (with the parameters in any order) get the recorded responses in order
+    assert replayed[1] == recorded[1]
+    assert replayed[2] == recorded[2]
+    assert replayed[3] == recorded[3]
+
+    with gzip.open(filename, "rt", encoding="utf-8") as f:
+        text = f.read()
+    assert "bearer-secret" not in text and "csrf-secret" not in text and "session=1" not in text
+
+
+def test_replay_serves_last_response_again_and_raises_for_status(tmp_path):
+    filename = str(tmp_path / "cassette.json.gz")
+    cassette.start_recording()
+    asyncio.run(run_exchanges(make_session(), REQUESTS))
+    cassette.save(filename)
+    cassette.recording = None
+    cassette.load(filename)
+
+    async def replay_twice():
+        bodies = []
+        for i in range(2):
+            async with cassette.exchange(None, 'GET', BASE_URL + "/api/licenses/1/text", {'accept': "text/plain"},
+                                         None) as resp:
+                bodies.append(await resp.text())
+                with pytest.raises(aiohttp.ClientResponseError) as exc:
+                    resp.raise_for_status()
+                assert exc.value.status == 404
+        return bodies
+
+    assert asyncio.run(replay_twice()) == ["not found", "not found"]
+
+
+def test_replay_miss(tmp_path):
+    filename = str(tmp_path / "cassette.json.gz")
+    cassette.start_recording()
+    cassette.save(filename)
+    cassette.recording = None
+    cassette.load(filename)
+
+    async def request():
+        async with cassette.exchange(None, 'GET', BASE_URL + "/api/other", {'accept': "application/json"}, None):
+            pass
+
+    with pytest.raises(cassette.CassetteMiss):
+        asyncio.run(request())
+
+
+def test_load_rejects_other_format(tmp_path):
+    filename = str(tmp_path / "cassette.json.gz")
+    with gzip.open(filename, "wt", encoding="utf-8") as f:
+        json.dump({'format': cassette.CASSETTE_FORMAT + 1, 'exchanges': []}, f)
+    with pytest.raises(SystemExit) as exc:
+        cassette.load(filename)
+    assert exc.value.code == 2
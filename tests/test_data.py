@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+import json
+import random
+import re
+
+import pytest
+
+from export_spdx import config
+from export_spdx import data
+from export_spdx import spdx
+
+
+def string_clean_for_spdx(name):
+    # The identifier cleaning used before the translate tables
+    newname = re.sub('[;:!*()/,]', '', name)
+    newname = re.sub('[ .]', '', newname)
+    newname = re.sub('@', '-at-', newname)
+    newname = re.sub('_', 'uu', newname)
+
+    return newname
+
+
+def string_quote(name):
+    remove_chars = ['"', "'"]
+    for i in remove_chars:
+        name = name.replace(i, '')
+    return name
+
+
+def string_calculate_purl(namespace, extid):
+    # The purl calculation used before the per-namespace parsers
+    if namespace in spdx.spdx_origin_map.keys():
+        ns_split = extid.split(spdx.spdx_origin_map[namespace]['p_sep'])
+        if namespace not in ['npmjs', 'maven'] and len(ns_split) > 2:  # 2
+            compid, compver = extid.split(spdx.spdx_origin_map[namespace]['p_sep'], maxsplit=1)
+        elif spdx.spdx_origin_map[namespace]['p_sep'] in extid:
+            compid, compver = extid.rsplit(spdx.spdx_origin_map[namespace]['p_sep'], maxsplit=1)
+        else:
+            compid, compver = extid, None
+
+        purl = "pkg:" + spdx.spdx_origin_map[namespace]['p_type']  # 3
+
+        if spdx.spdx_origin_map[namespace]['p_namespace'] != '':  # 4
+            purl += "/" + spdx.spdx_origin_map[namespace]['p_namespace']
+
+        if spdx.spdx_origin_map[namespace]['p_sep'] in compid:  # 5
+            purl += '/' + '/'.join(string_quote(s) for s in compid.split(spdx.spdx_origin_map[namespace]['p_sep']))
+        else:  # 6
+            if namespace == 'pypi':
+                purl += '/' + string_quote(re.sub('[-_.]+', '-', compid.lower()))
+            else:
+                purl += '/' + string_quote(compid)
+
+        qual = {}
+        if compver:
+            if spdx.spdx_origin_map[namespace]['p_sep'] in compver:  # 9
+                compver, qual['arch'] = compver.split(spdx.spdx_origin_map[namespace]['p_sep'])
+
+            purl += '@' + string_quote(re.sub(r"^\d+:", '', compver))  # 7
+
+            epoch_m = re.match(r'^(\d+):', compver)  # 10
+            if epoch_m:
+                qual['epoch'] = epoch_m[1]
+
+        if qual:
+            purl += '?' + '&'.join('='.join([k, string_quote(v)]) for k, v in qual.items())  # 8
+
+        return purl
+    return ''
+
+
+def result(func, *args):
+    # The value returned, or the type of exception raised (ids with too many separators fail in both versions)
+    try:
+        return func(*args)
+    except Exception as exc:
+        return type(exc)
+
+
+PURL_IDS = [
+    ("pypi", "Django_REST.framework/3.1.0"),
+    ("pypi", "zope.interface/1:5.1.0"),
+    ("pypi", "requests"),
+    ("pypi", "requests/"),
+    ("maven", "org.apache.commons:commons-lang3:3.9"),
+    ("maven", "junit:junit"),
+    ("npmjs", "@babel/core/7.10.2"),
+    ("npmjs", "lodash/4.17.15"),
+    ("debian", "openssl/1.1.1d-0+deb10u3/amd64"),
+    ("centos", "bash/4.2.46-34.el7/x86_64"),
+    ("ubuntu", "libc6/2:2.31-0ubuntu9/amd64"),
+    ("alpine", "musl/1.1.24-r2/x86_64"),
+    ("fedora", "glibc/12:2.31-2.fc32/x86_64"),
+    ("github", "torvalds:linux:v5.7"),
+    ("golang", "github.com/pkg/errors:v0.9.1"),
+    ("golang", "golang.org/x/net:v0.0.0:extra"),
+    ("nuget", "Newtonsoft.Json/12.0.3"),
+    ("rubygems", "rails/6.0.3"),
+    ("packagist", "symfony/console:v5.1.0"),
+    ("yocto", "poky:busybox/1.31.1"),
+    ("unknown", "name/1.0"),
+]
+
+
+@pytest.mark.parametrize('namespace,extid', PURL_IDS)
+def test_purl_table_matches_string_version(namespace, extid):
+    assert result(data.calculate_purl, namespace, extid) == result(string_calculate_purl, namespace, extid)
+
+
+def random_id(rng, sep):
+    # Names and versions with separators, epochs, quotes and the characters normalized for PyPI
+    parts = []
+    for i in range(rng.randint(1, 4)):
+        part = ''.join(rng.choice("abcXYZ019-_.'\"@+ ") for n in range(rng.randint(0, 6)))
+        if rng.random() < 0.2:
+            part = str(rng.randint(0, 12)) + ':' + part
+        parts.append(part)
+    return rng.choice([sep, sep, '/', ':']).join(parts)
+
+
+def test_purls_match_string_version_for_every_namespace():
+    rng = random.Random(1)
+    for namespace, origin in spdx.spdx_origin_map.items():
+        for i in range(2000):
+            extid = random_id(rng, origin['p_sep'])
+            assert result(data.calculate_purl, namespace, extid) == \
+                result(string_calculate_purl, namespace, extid), (namespace, extid)
+
+
+def test_identifiers_match_string_version():
+    rng = random.Random(2)
+    names = ["SPDXRef-Package-comp_1-1.0", "a;b:c!d*e(f)g/h,i j.k@l_m", "Quote's \"name\"", "", "Ünïcode @ x"]
+    names += [''.join(rng.choice(";:!*()/, .@_\"'aZ9-é") for n in range(rng.randint(0, 12))) for i in range(5000)]
+    for name in names:
+        assert spdx.clean_for_spdx(name) == string_clean_for_spdx(name)
+        assert spdx.quote_name(name) == string_quote(name)
+        assert spdx.quote(name) == string_quote(name)
+
+
+class FakeClient:
+    # Serves pages of a list of total items - later offsets are answered sooner, so pages arrive out of order
+    def __init__(self, total):
+        self.total = total
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.cancelled = 0
+
+    async def get_text(self, url, headers=None, params=None, share=True):
+        self.requests.append(dict(params))
+        offset = params.get('offset', 0)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if offset > 0:
+                await asyncio.sleep(0.001 * (self.total - offset) / 100)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.in_flight -= 1
+        items = list(range(offset, min(offset + params['limit'], self.total)))
+        return json.dumps({'totalCount': self.total, 'items': items})
+
+
+@pytest.fixture
+def paging(monkeypatch):
+    # Later pages are 300 items, fetched at most 3 at a time
+    monkeypatch.setattr(config, 'args', argparse.Namespace(blackduck_max_concurrency=3, debug=False))
+    sizes = []
+    monkeypatch.setattr(data, 'choose_page_size', lambda count, elapsed, size: sizes.append(count) or 300)
+    return sizes
+
+
+async def collect_pages(client):
+    pages = []
+    async for offset, items in data.iter_data_pages(client, "https://bd.example/api/list", {}):
+        pages.append((offset, items))
+    return pages
+
+
+def test_choose_page_size():
+    assert data.choose_page_size(0, 0.1, 10) == data.PAGE_MAX
+    # Fast, small responses keep the largest page size
+    assert data.choose_page_size(1000, 0.5, 100000) == 1000
+    # Slow responses are split to take about PAGE_TARGET_SECS, rounded down to a multiple of PAGE_MIN
+    assert data.choose_page_size(1000, 6.0, 100000) == 300
+    assert data.choose_page_size(1000, 3.0, 100000) == 600
+    # Large responses are split to about PAGE_TARGET_BYTES
+    assert data.choose_page_size(1000, 0.5, 10 * data.PAGE_TARGET_BYTES) == 100
+    assert data.choose_page_size(500, 0.5, data.PAGE_TARGET_BYTES) == 500
+    # But never below PAGE_MIN
+    assert data.choose_page_size(1000, 600.0, 1000 * data.PAGE_TARGET_BYTES) == data.PAGE_MIN
+
+
+def test_pages_fetched_concurrently_with_bounded_window(paging):
+    client = FakeClient(3250)
+    pages = asyncio.run(collect_pages(client))
+    assert paging == [1000]
+    assert pages[0] == (0, list(range(1000)))
+    assert client.requests[0] == {'limit': data.PAGE_MAX}
+    offsets = [offset for offset, items in pages[1:]]
+    assert sorted(offsets) == list(range(1000, 3250, 300))
+    assert offsets != sorted(offsets)
+    assert all(params['limit'] == 300 for params in client.requests[1:])
+    assert client.max_in_flight == 3
+
+
+def test_paged_items_are_returned_in_order(paging):
+    client = FakeClient(3250)
+    assert asyncio.run(data.get_data_paged(client, "https://bd.example/api/list", {})) == list(range(3250))
+
+
+@pytest.mark.parametrize('total', [0, 1, 1000])
+def test_single_page(paging, total):
+    client = FakeClient(total)
+    assert asyncio.run(data.get_data_paged(client, "https://bd.example/api/list", {})) == list(range(total))
+    assert len(client.requests) == 1
+    assert paging == []
+
+
+def test_pending_pages_cancelled_when_caller_stops(paging):
+    client = FakeClient(10000)
+
+    async def first_pages():
+        pages = data.iter_data_pages(client, "https://bd.example/api/list", {})
+        first = [await pages.__anext__(), await pages.__anext__()]
+        await pages.aclose()
+        # Let the cancelled requests finish - none of them are left running
+        await asyncio.sleep(0)
+        assert asyncio.all_tasks() == {asyncio.current_task()}
+        return first
+
+    assert len(asyncio.run(first_pages())) == 2
+    assert client.cancelled > 0
+    assert client.in_flight == 0
+    assert len(client.requests) <= 5
@@ -0,0 +1,112 @@
+import random
+
+from export_spdx import licenses
+from export_spdx import process
+from export_spdx import spdx
+
+
+def string_builder_licenses(lcomp, lic_texts, extracted):
+    # The license string builder used before license expressions were compiled
+    lic_string = "NOASSERTION"
+    quotes = False
+    if 'licenses' in lcomp.keys():
+        license_type, proc_item = process.get_comp_licenses(lcomp)
+
+        for lic in proc_item:
+            thislic = ''
+            if 'spdxId' in lic:
+                thislic = lic['spdxId']
+                if thislic in spdx.spdx_deprecated_dict.keys():
+                    thislic = spdx.spdx_deprecated_dict[thislic]
+            else:
+                # Custom license
+                try:
+                    thislic = 'LicenseRef-' + spdx.clean_for_spdx(lic['licenseDisplay'] + '-' + lcomp['componentName'])
+                    lic_text = lic_texts.get(lic['license'].split("/")[-1])
+                    if lic_text is not None:
+                        mydict = {
+                            'licenseID': spdx.quote(thislic),
+                            'extractedText': spdx.quote(lic_text)
+                        }
+                        extracted.append(mydict)
+                except KeyError:
+                    pass
+            if lic_string == "NOASSERTION":
+                lic_string = thislic
+            else:
+                if license_type == "DISJUNCTIVE":
+                    lic_string = lic_string + " OR " + thislic
+                else:
+                    lic_string = lic_string + " AND " + thislic
+                quotes = True
+
+        if quotes:
+            lic_string = "(" + lic_string + ")"
+
+    return lic_string
+
+
+def bom_licenses(items, license_type="DISJUNCTIVE"):
+    # Licenses as in a BOM entry - a single license, or several with the license type
+    if len(items) == 1:
+        return [dict(items[0], licenses=[])]
+    return [{'licenseType': license_type, 'licenses': items}]
+
+
+def random_license(rng):
+    if rng.random() < 0.5:
+        return {'spdxId': rng.choice(list(spdx.spdx_deprecated_dict) + ['MIT', 'Apache-2.0', 'Not-A-License-1.0'])}
+    lic = {}
+    if rng.random() < 0.9:
+        lic['licenseDisplay'] = rng.choice(["Custom A", "Quote's \"B\"", "Ünïcode (C)"])
+    if rng.random() < 0.9:
+        lic['license'] = "https://bd.example/api/licenses/" + rng.choice(['lic1', 'lic2', 'lic3'])
+    return lic
+
+
+def test_compiled_expression_matches_string_builder():
+    rng = random.Random(1)
+    lic_texts = {'lic1': "Text one", 'lic2': "Text \"two\""}
+    for i in range(20000):
+        items = [random_license(rng) for n in range(rng.randint(1, 3))]
+        comp = {'licenses': bom_licenses(items, rng.choice(["DISJUNCTIVE", "CONJUNCTIVE"]))}
+        if rng.random() < 0.95:
+            comp['componentName'] = rng.choice(["comp1", "comp 2"])
+        if rng.random() < 0.05:
+            comp = {}
+        expected_extracted = []
+        extracted = []
+        assert process.get_licenses(comp, lic_texts, extracted) == \
+            string_builder_licenses(comp, lic_texts, expected_extracted), comp
+        assert extracted == expected_extracted
+
+
+def test_deprecated_and_unknown_ids():
+    # Unknown IDs are found when an expression is compiled, so start without compiled expressions
+    licenses.compile_expression.cache_clear()
+    licenses.unknown_ids.clear()
+    comp = {'componentName': "c", 'licenses': bom_licenses([{'spdxId': 'GPL-2.0+'}, {'spdxId': 'Zlib'},
+                                                            {'spdxId': 'Not-A-License-1.0'}])}
+    assert process.get_licenses(comp, {}, []) == "(GPL-2.0-or-later OR Zlib OR Not-A-License-1.0)"
+    assert licenses.unknown_ids == {'Not-A-License-1.0'}
+
+
+def test_index_covers_deprecated_replacements():
+    assert licenses.LICENSE_LIST_VERSION == '3.9'
+    for lic, replacement in spdx.spdx_deprecated_dict.items():
+        assert licenses.license_index[lic] == replacement
+    assert licenses.license_index['MIT'] == 'MIT'
+
+
+def test_expression_lists_custom_license_refs():
+    items = [{'licenseDisplay': "Custom A", 'license': "https://bd.example/api/licenses/lic1"}, {'spdxId': 'MIT'}]
+    key = licenses.license_key("CONJUNCTIVE", items, "comp1")
+    assert licenses.compile_expression(key) == ("(LicenseRef-CustomA-comp1 AND MIT)",
+                                                (("LicenseRef-CustomA-comp1", 'lic1'),))
+
+
+def test_spdx_only_licenses_share_an_entry():
+    items = [{'spdxId': 'MIT'}, {'spdxId': 'ISC'}]
+    assert licenses.license_key("DISJUNCTIVE", items, "comp1") == licenses.license_key("DISJUNCTIVE", items, "comp2")
+    custom = [{'licenseDisplay': "Custom A", 'license': "https://bd.example/api/licenses/lic1"}]
+    assert licenses.license_key("NONE", custom, "comp1") != licenses.license_key("NONE", custom, "comp2")
@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from export_spdx import pipeline
+
+
+def comp(n):
+    return {'componentVersion': "https://bd.example/api/components/c/versions/{}".format(n), 'n': n}
+
+
+def test_components_enriched_once_and_rendered():
+    rendered = []
+    enriched = []
+
+    async def enrich(c):
+        enriched.append(c['n'])
+        return c['n'] * 10
+
+    async def run():
+        pipe = pipeline.Pipeline(enrich, lambda c, data: rendered.append((c['n'], data)), 3, 2)
+        pipe.start()
+        for n in [1, 2, 1, 3, 2]:
+            await pipe.put(comp(n))
+        await pipe.finish()
+        return pipe
+
+    pipe = asyncio.run(run())
+    assert sorted(enriched) == [1, 2, 3]
+    assert sorted(rendered) == [(1, 10), (2, 20), (3, 30)]
+    assert pipe.rendered == 3
+
+
+def test_bounded_queue_holds_back_producer():
+    release = asyncio.Event()
+    rendered = []
+
+    async def enrich(c):
+        await release.wait()
+        return c['n']
+
+    async def produce(pipe, puts):
+        for n in range(10):
+            await pipe.put(comp(n))
+            puts.append(n)
+
+    async def run():
+        pipe = pipeline.Pipeline(enrich, lambda c, data: rendered.append(data), 1, 2)
+        pipe.start()
+        puts = []
+        producer = asyncio.ensure_future(produce(pipe, puts))
+        for i in range(10):
+            await asyncio.sleep(0)
+        # One component is being enriched and two are queued - the fourth put waits for room in the queue
+        assert puts == [0, 1, 2]
+        assert not producer.done()
+        assert rendered == []
+        release.set()
+        await producer
+        await pipe.finish()
+
+    asyncio.run(run())
+    assert rendered == list(range(10))
+
+
+@pytest.mark.parametrize('failing', ['enrich', 'render'])
+def test_failure_raised_by_finish(failing):
+    rendered = []
+
+    async def enrich(c):
+        if failing == 'enrich' and c['n'] == 3:
+            raise ValueError("enrich failed")
+        return c['n']
+
+    def render(c, data):
+        if failing == 'render' and c['n'] == 3:
+            raise ValueError("render failed")
+        rendered.append(data)
+
+    async def run():
+        pipe = pipeline.Pipeline(enrich, render, 2, 2)
+        pipe.start()
+        # The queues keep draining after the failure, so the producer is not blocked
+        for n in range(50):
+            await pipe.put(comp(n))
+        await pipe.finish()
+
+    with pytest.raises(ValueError, match=failing + " failed"):
+        asyncio.run(run())
+    assert 3 not in rendered
+    assert len(rendered) < 49
+
+
+def test_finish_after_queue_emptied():
+    rendered = []
+
+    async def enrich(c):
+        return c['n']
+
+    async def run():
+        pipe = pipeline.Pipeline(enrich, lambda c, data: rendered.append(data), 2, 2)
+        pipe.start()
+        for n in range(5):
+            await pipe.put(comp(n))
+        # Everything put so far is rendered while the workers wait for more
+        for i in range(20):
+            await asyncio.sleep(0)
+        assert sorted(rendered) == list(range(5))
+        await pipe.put(comp(5))
+        await pipe.finish()
+
+    asyncio.run(run())
+    assert sorted(rendered) == list(range(6))
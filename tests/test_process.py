@@ -0,0 +1,29 @@
+import itertools
+
+from export_spdx import globals
+from export_spdx import process
+
+
+def chained_relationship_type(mtypes):
+    # Relationship type as chosen by the original loops over the match type tables
+    for tchecktype in globals.matchtype_depends_dict.keys():
+        if tchecktype in mtypes:
+            return globals.matchtype_depends_dict[tchecktype]
+    for tchecktype in globals.matchtype_contains_dict.keys():
+        if tchecktype in mtypes:
+            return globals.matchtype_contains_dict[tchecktype]
+    return None
+
+
+def test_relationship_type_matches_table_order():
+    mtypes = list(globals.matchtype_depends_dict) + list(globals.matchtype_contains_dict) + ['UNKNOWN']
+    for count in range(4):
+        for combination in itertools.permutations(mtypes, count):
+            assert process.get_relationship_type(list(combination)) == chained_relationship_type(combination)
+
+
+def test_relationship_type_is_memoized():
+    globals.matchtype_relationships.clear()
+    process.get_relationship_type(['SNIPPET', 'FILE_EXACT'])
+    process.get_relationship_type(['FILE_EXACT', 'SNIPPET', 'FILE_EXACT'])
+    assert globals.matchtype_relationships == {frozenset(['SNIPPET', 'FILE_EXACT']): "CONTAINS"}
@@ -0,0 +1,89 @@
+import asyncio
+import datetime
+import email.utils
+
+import aiohttp
+import pytest
+
+from export_spdx import cassette
+from export_spdx import retry
+
+
+def test_backoff_is_jittered_and_capped(monkeypatch):
+    bounds = []
+    monkeypatch.setattr(retry.random, 'uniform', lambda low, high: bounds.append((low, high)) or high)
+    policy = retry.RetryPolicy(base_delay=1.0, max_delay=10.0)
+    delays = [policy.backoff(attempt, '503') for attempt in range(6)]
+    assert bounds == [(0, 1.0), (0, 2.0), (0, 4.0), (0, 8.0), (0, 10.0), (0, 10.0)]
+    assert delays == [1.0, 2.0, 4.0, 8.0, 10.0, 10.0]
+    assert policy.retries == 6
+    assert policy.wait_time == sum(delays)
+    assert policy.by_reason == {'503': 6}
+
+
+def test_backoff_uses_retry_after(monkeypatch):
+    monkeypatch.setattr(retry.random, 'uniform', lambda low, high: pytest.fail("jitter used with Retry-After"))
+    policy = retry.RetryPolicy()
+    assert policy.backoff(0, '429', '7') == 7.0
+    assert policy.backoff(3, '429', '0') == 0.0
+
+
+def test_parse_retry_after():
+    assert retry.parse_retry_after(None) is None
+    assert retry.parse_retry_after('not a date') is None
+    assert retry.parse_retry_after('2.5') == 2.5
+    assert retry.parse_retry_after('-3') == 0.0
+    assert retry.parse_retry_after('86400') == retry.MAX_RETRY_AFTER
+    when = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=120)
+    assert 110 < retry.parse_retry_after(email.utils.format_datetime(when)) <= 120
+    past = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=120)
+    assert retry.parse_retry_after(email.utils.format_datetime(past)) == 0.0
+
+
+def test_allow_limits_attempts_and_run_budget():
+    policy = retry.RetryPolicy(max_retries=3, run_budget=2)
+    assert policy.allow(0) and policy.allow(2)
+    assert not policy.allow(3)
+    policy.backoff(0, '503', '0')
+    policy.backoff(0, '503', '0')
+    assert not policy.allow(0)
+
+
+def replay_entries(monkeypatch, url, entries):
+    key = cassette.exchange_key('GET', url, {'accept': "application/json"}, None)
+    monkeypatch.setattr(cassette, 'replaying', {key: entries})
+    monkeypatch.setattr(cassette, 'latency_scale', 0.0)
+
+
+def entry(status, body, headers=()):
+    return {'status': status, 'headers': [list(h) for h in headers], 'body': body, 'elapsed': 0.0}
+
+
+def test_async_request_retries_transient_status(monkeypatch):
+    url = "https://bd.example/api/x"
+    replay_entries(monkeypatch, url, [entry(503, '', [('Retry-After', '0')]), entry(502, '', [('Retry-After', '0')]),
+                                      entry(200, '{"ok": true}')])
+    monkeypatch.setattr(retry, 'policy', retry.RetryPolicy(max_retries=5))
+    result = asyncio.run(retry.async_request(None, 'GET', url, {'accept': "application/json"}, None))
+    assert result == {'ok': True}
+    assert retry.policy.by_reason == {'503': 1, '502': 1}
+
+
+def test_async_request_raises_when_retries_run_out(monkeypatch):
+    url = "https://bd.example/api/y"
+    replay_entries(monkeypatch, url, [entry(503, '', [('Retry-After', '0')])])
+    monkeypatch.setattr(retry, 'policy', retry.RetryPolicy(max_retries=2))
+    with pytest.raises(aiohttp.ClientResponseError) as exc:
+        asyncio.run(retry.async_request(None, 'GET', url, {'accept': "application/json"}, None))
+    assert exc.value.status == 503
+    assert retry.policy.retries == 2
+
+
+def test_async_request_does_not_retry_client_errors(monkeypatch):
+    url = "https://bd.example/api/z"
+    replay_entries(monkeypatch, url, [entry(404, ''), entry(200, '{}')])
+    monkeypatch.setattr(retry, 'policy', retry.RetryPolicy())
+    with pytest.raises(aiohttp.ClientResponseError) as exc:
+        asyncio.run(retry.async_request(None, 'GET', url, {'accept': "application/json"}, None))
+    assert exc.value.status == 404
+    assert retry.policy.retries == 0
@@ -0,0 +1,94 @@
+import json
+
+from export_spdx import sbom
+
+
+def test_relationship_types_fit_in_key():
+    # The relationship type is packed into the low 6 bits of the duplicate key
+    assert max(sbom.RelationshipType) < 64
+
+
+def test_graph_interns_ids_and_skips_duplicates():
+    graph = sbom.RelationshipGraph()
+    graph.add("SPDXRef-A", "CONTAINS", "SPDXRef-B")
+    graph.add("SPDXRef-A", "CONTAINS", "SPDXRef-B")
+    graph.add("SPDXRef-A", "DYNAMIC_LINK", "SPDXRef-B")
+    graph.add("SPDXRef-B", "CONTAINS", "SPDXRef-A")
+    assert graph.count() == 3
+    assert graph.duplicates == 1
+    assert graph.id_names == ["SPDXRef-A", "SPDXRef-B"]
+    assert list(graph) == [
+        ("SPDXRef-A", "CONTAINS", "SPDXRef-B"),
+        ("SPDXRef-A", "DYNAMIC_LINK", "SPDXRef-B"),
+        ("SPDXRef-B", "CONTAINS", "SPDXRef-A"),
+    ]
+
+
+def test_graph_keys_do_not_collide_for_large_indexes():
+    # Parent and child indexes are packed either side of the relationship type, so triples which differ only
+    # in the position of their fields must not share a key
+    graph = sbom.RelationshipGraph()
+    big = 2 ** 32 - 1
+    assert graph.add_triple(1, sbom.RelationshipType.CONTAINS, 0)
+    assert graph.add_triple(0, sbom.RelationshipType.CONTAINS, 1)
+    assert graph.add_triple(big, sbom.RelationshipType.OTHER, big)
+    assert graph.add_triple(big, sbom.RelationshipType.DESCRIBES, big)
+    assert graph.add_triple(0, sbom.RelationshipType.OTHER, big)
+    assert graph.add_triple(big, sbom.RelationshipType.OTHER, 0)
+    assert not graph.add_triple(big, sbom.RelationshipType.OTHER, big)
+    assert graph.count() == 6
+
+
+def test_graph_replays_triples():
+    graph = sbom.RelationshipGraph()
+    graph.add("SPDXRef-A", "CONTAINS", "SPDXRef-B")
+    first = graph.count()
+    graph.add("SPDXRef-B", "STATIC_LINK", "SPDXRef-C")
+    graph.add("SPDXRef-C", "OTHER", "SPDXRef-D")
+    replay = graph.triples_from(first)
+    assert len(replay) == 6
+
+    copy = sbom.RelationshipGraph()
+    for name in graph.id_names:
+        copy.intern(name)
+    copy.add_triples(replay)
+    copy.add_triples(replay)
+    assert list(copy) == list(graph)[first:]
+    assert copy.duplicates == 2
+
+
+def test_graph_json_matches_json_dump():
+    graph = sbom.RelationshipGraph()
+    graph.add("SPDXRef-DOCUMENT", "DESCRIBES", "SPDXRef-Package-x")
+    graph.add("SPDXRef-Package-x", "CONTAINS", "SPDXRef-Package-é\\\"")
+    expected = [json.dumps({
+        "spdxElementId": parent,
+        "relationshipType": reln,
+        "relatedSpdxElement": child
+    }, indent=4, sort_keys=True) for parent, reln, child in graph]
+    assert list(graph.iter_json()) == expected
+
+
+def test_document_lists_relationships():
+    doc = sbom.SBOM()
+    doc.graph.add("SPDXRef-DOCUMENT", "DESCRIBES", "SPDXRef-Package-x")
+    doc.add_package(sbom.Package(SPDXID="SPDXRef-Package-x", name="x"))
+    assert doc.document()['relationships'] == [{
+        "spdxElementId": "SPDXRef-DOCUMENT",
+        "relationshipType": "DESCRIBES",
+        "relatedSpdxElement": "SPDXRef-Package-x"
+    }]
+    assert doc.document()['packages'] == [{'SPDXID': "SPDXRef-Package-x", 'name': "x"}]
+
+
+def test_graph_children_and_parents():
+    graph = sbom.RelationshipGraph()
+    graph.add("SPDXRef-A", "CONTAINS", "SPDXRef-B")
+    graph.add("SPDXRef-A", "DYNAMIC_LINK", "SPDXRef-C")
+    assert graph.children("SPDXRef-A") == [("CONTAINS", "SPDXRef-B"), ("DYNAMIC_LINK", "SPDXRef-C")]
+    assert graph.parents("SPDXRef-C") == [("DYNAMIC_LINK", "SPDXRef-A")]
+    assert graph.children("SPDXRef-B") == []
+    assert graph.parents("SPDXRef-unknown") == []
+    # The index is rebuilt after the graph changes
+    graph.add("SPDXRef-C", "OTHER", "SPDXRef-B")
+    assert graph.parents("SPDXRef-B") == [("CONTAINS", "SPDXRef-A"), ("OTHER", "SPDXRef-C")]
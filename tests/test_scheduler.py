@@ -0,0 +1,25 @@
+import pytest
+
+from export_spdx import globals
+from export_spdx import scheduler
+
+
+def test_parse_class_limits_defaults():
+    limits = scheduler.parse_class_limits('', 16)
+    assert limits == {epclass: 16 for epclass in globals.endpoint_classes}
+    assert scheduler.parse_class_limits(None, 4)['copyrights'] == 4
+
+
+def test_parse_class_limits_overrides():
+    limits = scheduler.parse_class_limits(' copyrights=8, matched-files = 4,', 16)
+    assert limits['copyrights'] == 8
+    assert limits['matched-files'] == 4
+    assert limits['comments'] == 16
+
+
+@pytest.mark.parametrize('limit_str', ['copyrights', 'copyrights=x', 'copyrights=1=2', 'unknown=4', 'comments=0'])
+def test_parse_class_limits_invalid(limit_str, capsys):
+    with pytest.raises(SystemExit) as exc:
+        scheduler.parse_class_limits(limit_str, 16)
+    assert exc.value.code == 2
+    assert capsys.readouterr().out.startswith("ERROR: ")